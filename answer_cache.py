@@ -0,0 +1,200 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_ANSWER_CACHE_PATH = os.environ.get("ANSWER_CACHE_PATH", "answer_cache.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    question TEXT NOT NULL,
+    embedding BLOB NOT NULL,
+    answer TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS answer_chunks (
+    answer_id INTEGER NOT NULL REFERENCES answers(id) ON DELETE CASCADE,
+    chunk_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS answer_chunks_chunk ON answer_chunks(chunk_id);
+"""
+
+
+def _connect(path):
+    conn = sqlite3.connect(str(path), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+# Connections for invalidate_chunks, opened once per path and shared by writers
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def invalidate_chunks(chunk_ids, path=DEFAULT_ANSWER_CACHE_PATH):
+    """
+    Drop cached answers whose context used any of `chunk_ids`. Called by the
+    ingest and extraction writers; a no-op when no answer cache exists.
+    """
+    chunk_ids = list(chunk_ids)
+    if not chunk_ids or not Path(path).exists():
+        return 0
+    path = str(path)
+    with _connections_lock:
+        conn = _connections.get(path)
+        if conn is None:
+            conn = _connections[path] = _connect(path)
+        deleted = 0
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start : start + 500]
+            cur = conn.execute(
+                f"""
+                DELETE FROM answers WHERE id IN (
+                    SELECT answer_id FROM answer_chunks
+                    WHERE chunk_id IN ({",".join("?" * len(batch))})
+                )
+                """,
+                batch,
+            )
+            deleted += cur.rowcount
+        conn.commit()
+        return deleted
+
+
+class AnswerCache:
+    """
+    Persistent semantic cache of answers keyed by question embedding.
+
+    A lookup hits when the cosine similarity to a stored question is at least
+    `threshold` and the entry is younger than `ttl` seconds. Beyond `max_entries`
+    the least recently used answers are evicted. Entries are deleted when a chunk
+    in their context is re-ingested (see `invalidate_chunks`).
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_ANSWER_CACHE_PATH,
+        threshold=0.95,
+        ttl=24 * 3600,
+        max_entries=1000,
+    ):
+        self.path = str(path)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = _connect(self.path)
+        self._load()
+
+    def _load(self):
+        rows = self._conn.execute(
+            "SELECT id, embedding FROM answers WHERE created_at >= ? ORDER BY id",
+            (time.time() - self.ttl,),
+        ).fetchall()
+        self._ids = [row[0] for row in rows]
+        if rows:
+            self._matrix = np.stack(
+                [np.frombuffer(row[1], dtype=np.float32) for row in rows]
+            )
+        else:
+            self._matrix = None
+
+    @staticmethod
+    def _normalise(embedding):
+        vec = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def lookup(self, embedding):
+        """Return the cached answer for a near-identical question, or None."""
+        q = self._normalise(embedding)
+        with self._lock:
+            if self._matrix is not None and self._matrix.shape[1] == q.shape[0]:
+                scores = self._matrix @ q
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    # Another process may have invalidated or expired the entry.
+                    row = self._conn.execute(
+                        "SELECT answer, created_at FROM answers WHERE id = ?",
+                        (self._ids[i],),
+                    ).fetchone()
+                    if row is None or row[1] < time.time() - self.ttl:
+                        continue
+                    self._conn.execute(
+                        "UPDATE answers SET last_used = ? WHERE id = ?",
+                        (time.time(), self._ids[i]),
+                    )
+                    self._conn.commit()
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def store(self, question, embedding, answer, chunk_ids):
+        now = time.time()
+        blob = self._normalise(embedding).tobytes()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO answers VALUES (NULL, ?, ?, ?, ?, ?)",
+                (question, blob, answer, now, now),
+            )
+            self._conn.executemany(
+                "INSERT INTO answer_chunks VALUES (?, ?)",
+                [(cur.lastrowid, cid) for cid in dict.fromkeys(chunk_ids)],
+            )
+            stale = [
+                row[0]
+                for row in self._conn.execute(
+                    """
+                    SELECT id FROM answers WHERE created_at < ? OR id NOT IN (
+                        SELECT id FROM answers ORDER BY last_used DESC LIMIT ?
+                    )
+                    """,
+                    (now - self.ttl, self.max_entries),
+                )
+            ]
+            self._conn.executemany(
+                "DELETE FROM answers WHERE id = ?", [(i,) for i in stale]
+            )
+            self._conn.commit()
+            self._apply(cur.lastrowid, blob, stale)
+
+    def _apply(self, new_id, blob, removed):
+        """Update the in-memory matrix for one store instead of reloading it."""
+        if removed and self._matrix is not None:
+            removed = set(removed)
+            keep = [i for i, id_ in enumerate(self._ids) if id_ not in removed]
+            self._ids = [self._ids[i] for i in keep]
+            self._matrix = self._matrix[keep]
+        vec = np.frombuffer(blob, dtype=np.float32)[None, :]
+        self._ids.append(new_id)
+        if self._matrix is None or not len(self._matrix):
+            self._matrix = vec
+        else:
+            self._matrix = np.vstack([self._matrix, vec])
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._ids),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+            self._load()
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,375 @@
+"""
+End-to-end benchmark of PDF parsing, `DocumentIngestor.ingest`,
+`TripletExtractor.process_chunks` and `SemanticAgent.run_query` on a synthetic
+corpus, with fake OpenAI models and an in-memory Neo4j stand-in.
+
+    python -m benchmarks.bench_e2e --size small --save benchmarks/baseline.json
+    python -m benchmarks.bench_e2e --size small --compare benchmarks/baseline.json
+
+Per stage it reports throughput, p50/p95/p99 latency per document (per question
+for queries), Cypher round trips, model calls, injected API failures and peak
+traced memory. `--compare` prints the change against a saved run and exits with
+status 1 if any stage got slower, chattier or bigger by more than `--tolerance`.
+`--neo4j-uri` runs against a real, disposable Neo4j (e.g. a local container)
+instead of the stand-in; the benchmark writes into that database.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.corpus import SIZES, make_corpus, questions
+from benchmarks.fakes import FakeChatModel, FakeEmbeddings, MemoryDriver
+from document_ingestor import DocumentIngestor, split_pdf
+from entity_resolver import EntityResolver
+from extraction_cache import ExtractionCache
+from ontology_store import ONTOLOGY_PATH, OntologyStore
+from semantic_agent import SemanticAgent
+from triplet_extractor import TripletExtractor
+
+# Metrics where a higher value is a regression, compared by --compare.
+REGRESSION_METRICS = ["seconds", "p95_ms", "round_trips", "llm_calls", "peak_mb"]
+
+
+class CountingDriver:
+    """Wraps a neo4j driver and counts the statements sent through it."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.round_trips = 0
+        self._lock = threading.Lock()
+
+    def count(self):
+        with self._lock:
+            self.round_trips += 1
+
+    def session(self, **kwargs):
+        return CountingSession(self, self.driver.session(**kwargs))
+
+    def close(self):
+        self.driver.close()
+
+
+class CountingTx:
+    def __init__(self, counter, tx):
+        self.counter = counter
+        self.tx = tx
+
+    def run(self, query, parameters=None, **kwargs):
+        self.counter.count()
+        return self.tx.run(query, parameters, **kwargs)
+
+
+class CountingSession:
+    def __init__(self, counter, session):
+        self.counter = counter
+        self.session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.session.close()
+        return False
+
+    def close(self):
+        self.session.close()
+
+    def run(self, query, parameters=None, **kwargs):
+        self.counter.count()
+        return self.session.run(query, parameters, **kwargs)
+
+    def execute_write(self, fn, *args, **kwargs):
+        return self.session.execute_write(
+            lambda tx, *a, **kw: fn(CountingTx(self.counter, tx), *a, **kw),
+            *args,
+            **kwargs,
+        )
+
+    def execute_read(self, fn, *args, **kwargs):
+        return self.session.execute_read(
+            lambda tx, *a, **kw: fn(CountingTx(self.counter, tx), *a, **kw),
+            *args,
+            **kwargs,
+        )
+
+
+class Stage:
+    """
+    Times one stage: per-item latencies, errors, counter deltas and the peak of
+    traced memory above what was allocated when the stage started.
+    """
+
+    def __init__(self, name, counters):
+        self.name = name
+        self.counters = counters
+        self.latencies = []
+        self.items = 0
+        self.errors = 0
+
+    def __enter__(self):
+        self._before = self.counters()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            self._base = tracemalloc.get_traced_memory()[0]
+        self._start = time.perf_counter()
+        return self
+
+    def time(self, fn, *args, **kwargs):
+        """Call `fn`, recording its latency; failures are logged and return None."""
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            self.errors += 1
+            logging.warning(f"{self.name}: {e}")
+            return None
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self._start
+        peak = None
+        if tracemalloc.is_tracing():
+            peak = (tracemalloc.get_traced_memory()[1] - self._base) / 1024**2
+        after = self.counters()
+        latencies = np.asarray(self.latencies or [0.0]) * 1000
+        self.result = {
+            "items": self.items,
+            "errors": self.errors,
+            "seconds": round(seconds, 3),
+            "items_per_s": round(self.items / seconds, 2) if seconds else 0.0,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+            **{k: after[k] - self._before[k] for k in after},
+            "peak_mb": None if peak is None else round(peak, 2),
+        }
+        return False
+
+
+def run(args, workdir):
+    documents, pages = SIZES[args.size]
+    paths = make_corpus(
+        args.corpus_dir or workdir / "corpus",
+        args.documents or documents,
+        args.pages or pages,
+        args.seed,
+    )
+    embedder = FakeEmbeddings(
+        dim=args.dim,
+        latency=args.embed_latency,
+        failure_rate=args.embed_failure_rate,
+        seed=args.seed,
+    )
+    llm = FakeChatModel(
+        latency=args.llm_latency,
+        token_latency=args.token_latency,
+        malformed_rate=args.malformed_rate,
+        failure_rate=args.llm_failure_rate,
+        seed=args.seed,
+    )
+    if args.neo4j_uri:
+        from neo4j import GraphDatabase
+
+        from schema_manager import SchemaManager
+
+        driver = CountingDriver(
+            GraphDatabase.driver(
+                args.neo4j_uri,
+                auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+            )
+        )
+        SchemaManager(driver).ensure_all()
+    else:
+        driver = MemoryDriver(latency=args.db_latency)
+
+    def counters():
+        return {
+            "round_trips": driver.round_trips,
+            "embed_calls": embedder.calls,
+            "llm_calls": llm.calls,
+            "api_failures": embedder.failures + llm.failures,
+            "prompt_tokens": llm.prompt_tokens,
+            "completion_tokens": llm.completion_tokens,
+        }
+
+    # Caches, aliases and ontology changes stay in the scratch directory.
+    ontology_path = workdir / "ontology.json"
+    shutil.copy(ONTOLOGY_PATH, ontology_path)
+
+    stages = {}
+    parsed = []
+    with Stage("parse", counters) as stage:
+        for path in paths:
+            chunks = stage.time(split_pdf, path, path.stem)
+            if chunks is not None:
+                stage.items += len(chunks)
+                parsed.append((path, chunks))
+    stages["parse"] = stage.result
+
+    with Stage("ingest", counters) as stage:
+        for path, chunks in parsed:
+            ingestor = DocumentIngestor(
+                path,
+                path.stem,
+                embed_batch_size=args.embed_batch_size,
+                write_batch_size=args.write_batch_size,
+                driver=driver,
+                embedder=embedder,
+            )
+            stage.time(ingestor.ingest, chunks=chunks)
+            stage.items += len(chunks)
+    stages["ingest"] = stage.result
+
+    extractor = TripletExtractor(
+        max_concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        driver=driver,
+        extraction_cache=ExtractionCache(workdir / "extraction_cache.sqlite"),
+        pack_token_budget=args.pack_token_budget or None,
+        llm=llm,
+        entity_resolver=EntityResolver(
+            workdir / "entity_aliases.sqlite", embedder=embedder
+        ),
+        ontology=OntologyStore(ontology_path, embedder=embedder),
+    )
+    with Stage("extract", counters) as stage:
+        with contextlib.redirect_stdout(io.StringIO()):
+            for path, chunks in parsed:
+                stage.time(extractor.process_chunks, chunks)
+                stage.items += len(chunks)
+    stages["extract"] = stage.result
+
+    agent = SemanticAgent(
+        top_k=args.top_k,
+        answer_cache=False,
+        embeddings=embedder,
+        llm=llm,
+        driver=driver,
+    )
+    with Stage("query", counters) as stage:
+        for question in questions(args.questions, args.seed):
+            stage.time(agent.run_query, question)
+            stage.items += 1
+    stages["query"] = stage.result
+
+    driver.close()
+    return {
+        "config": {
+            "documents": len(paths),
+            "chunks": sum(len(chunks) for _, chunks in parsed),
+            **{
+                k: v
+                for k, v in vars(args).items()
+                if k not in {"save", "compare", "corpus_dir", "tolerance"}
+            },
+        },
+        "stages": stages,
+    }
+
+
+def print_report(results):
+    print(
+        f"{'stage':<9}{'items':>7}{'err':>5}{'seconds':>9}{'items/s':>9}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'db trips':>10}"
+        f"{'llm':>6}{'embed':>7}{'fails':>7}{'peak MB':>9}"
+    )
+    for name, s in results["stages"].items():
+        peak = "-" if s["peak_mb"] is None else f"{s['peak_mb']:.1f}"
+        print(
+            f"{name:<9}{s['items']:>7}{s['errors']:>5}{s['seconds']:>9.2f}"
+            f"{s['items_per_s']:>9.1f}{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}"
+            f"{s['p99_ms']:>9.1f}{s['round_trips']:>10}{s['llm_calls']:>6}"
+            f"{s['embed_calls']:>7}{s['api_failures']:>7}{peak:>9}"
+        )
+
+
+def compare(results, baseline, tolerance):
+    """Print per-stage changes against `baseline`; returns the regressions found."""
+    regressions = []
+    print(f"\nChange vs baseline (regression above +{tolerance:.0%}):")
+    for name, s in results["stages"].items():
+        old = baseline["stages"].get(name)
+        if old is None:
+            continue
+        changes = []
+        for metric in REGRESSION_METRICS:
+            if s.get(metric) is None or not old.get(metric):
+                continue
+            change = s[metric] / old[metric] - 1
+            flag = ""
+            if change > tolerance:
+                flag = " ⚠️"
+                regressions.append((name, metric, change))
+            changes.append(f"{metric} {change:+.0%}{flag}")
+        print(f"  {name:<9}" + ", ".join(changes))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", choices=SIZES, default="small")
+    parser.add_argument("--documents", type=int, help="Overrides --size")
+    parser.add_argument("--pages", type=int, help="Overrides --size")
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", help="Keep generated PDFs here between runs")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--embed-latency", type=float, default=0.02)
+    parser.add_argument("--embed-failure-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.001)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.002)
+    parser.add_argument("--embed-batch-size", type=int, default=64)
+    parser.add_argument("--write-batch-size", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=5000)
+    parser.add_argument("--tpm", type=int, default=2_000_000)
+    parser.add_argument("--pack-token-budget", type=int, default=0)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="Skip tracemalloc, which slows Python-heavy stages down",
+    )
+    parser.add_argument("--neo4j-uri", help="Use this Neo4j instead of the stand-in")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    if not args.no_memory:
+        tracemalloc.start()
+    with tempfile.TemporaryDirectory(prefix="bench-e2e-") as workdir:
+        results = run(args, Path(workdir))
+    tracemalloc.stop()
+
+    print_report(results)
+    if args.save:
+        Path(args.save).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"\n💾 Saved results to {args.save}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
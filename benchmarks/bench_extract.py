@@ -0,0 +1,87 @@
+"""
+Compare one-chunk-per-request and packed `TripletExtractor.process_chunks` against a
+fake chat model and a stub Neo4j session.
+
+    python -m benchmarks.bench_extract --chunks 500 --pack-budgets 0,1000,2000,4000
+"""
+
+import argparse
+import contextlib
+import io
+import logging
+import time
+
+from benchmarks.bench_ingest import synthetic_chunks
+from benchmarks.fakes import FakeChatModel, StubDriver
+from triplet_extractor import TripletExtractor
+
+# gpt-4o-mini list prices, USD per million tokens
+INPUT_PRICE = 0.15
+OUTPUT_PRICE = 0.60
+
+
+def run(chunks, budget, args):
+    llm = FakeChatModel(
+        latency=args.latency,
+        token_latency=args.token_latency,
+        malformed_rate=args.malformed_rate,
+    )
+    extractor = TripletExtractor(
+        max_concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        driver=StubDriver(latency=args.db_latency),
+        extraction_cache=False,
+        entity_resolver=False,
+        pack_token_budget=budget or None,
+        llm=llm,
+    )
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        extractor.process_chunks(chunks)
+    elapsed = time.perf_counter() - start
+    cost = (
+        llm.prompt_tokens * INPUT_PRICE + llm.completion_tokens * OUTPUT_PRICE
+    ) / 1e6
+    return elapsed, llm, cost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument(
+        "--pack-budgets",
+        default="0,1000,2000,4000",
+        help="Comma-separated pack token budgets; 0 is one chunk per request",
+    )
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=500)
+    parser.add_argument("--tpm", type=int, default=200_000)
+    parser.add_argument("--db-latency", type=float, default=0.002)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    chunks = [
+        chunk.__class__(
+            page_content=chunk.page_content, metadata={"chunk_id": f"bench:{i}"}
+        )
+        for i, chunk in enumerate(synthetic_chunks(args.chunks))
+    ]
+    print(
+        f"{'budget':>8}{'seconds':>10}{'chunks/s':>10}{'requests':>10}"
+        f"{'in tok':>10}{'out tok':>10}{'cost $':>10}"
+    )
+    for budget in (int(b) for b in args.pack_budgets.split(",")):
+        elapsed, llm, cost = run(chunks, budget, args)
+        print(
+            f"{budget or 'single':>8}{elapsed:>10.2f}{len(chunks) / elapsed:>10.1f}"
+            f"{llm.calls:>10}{llm.prompt_tokens:>10}{llm.completion_tokens:>10}"
+            f"{cost:>10.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compare batched and per-chunk `DocumentIngestor.ingest` against a fake embedder and a
+stub Neo4j session.
+
+    python -m benchmarks.bench_ingest --chunks 2000 --embed-latency 0.05
+"""
+
+import argparse
+import logging
+import time
+
+from langchain_core.documents import Document
+
+from benchmarks.fakes import FakeEmbeddings, StubDriver
+from document_ingestor import DocumentIngestor
+
+
+def synthetic_chunks(n, size=500):
+    base = "The Ministry of Finance allocated funds to the Broadband Scheme. "
+    return [
+        Document(page_content=(f"[{i}] " + base * (size // len(base) + 1))[:size])
+        for i in range(n)
+    ]
+
+
+def run(chunks, batched, args):
+    embedder = FakeEmbeddings(dim=args.dim, latency=args.embed_latency)
+    driver = StubDriver(latency=args.db_latency)
+    ingestor = DocumentIngestor(
+        "synthetic.pdf",
+        "bench",
+        embed_batch_size=args.embed_batch_size,
+        write_batch_size=args.write_batch_size,
+        driver=driver,
+        embedder=embedder,
+    )
+    start = time.perf_counter()
+    ingestor.ingest(chunks=chunks, batched=batched)
+    elapsed = time.perf_counter() - start
+    return elapsed, embedder.calls, driver.round_trips
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--db-latency", type=float, default=0.002)
+    parser.add_argument("--embed-batch-size", type=int, default=64)
+    parser.add_argument("--write-batch-size", type=int, default=256)
+    parser.add_argument(
+        "--skip-sequential", action="store_true", help="Only time batched mode"
+    )
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    chunks = synthetic_chunks(args.chunks)
+    modes = [("batched", True)]
+    if not args.skip_sequential:
+        modes.append(("sequential", False))
+
+    print(f"{'mode':<12}{'seconds':>10}{'chunks/s':>12}{'embed calls':>14}{'db trips':>10}")
+    for name, batched in modes:
+        elapsed, calls, trips = run(chunks, batched, args)
+        print(
+            f"{name:<12}{elapsed:>10.2f}{len(chunks) / elapsed:>12.1f}{calls:>14}{trips:>10}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Parse throughput and triplets recovered for the old `ast.literal_eval` parser and
+`triplet_parser.parse_triplet_output` over a corpus of raw LLM responses.
+
+    TRIPLET_RESPONSE_LOG=responses.jsonl python main.py   # record a corpus
+    python -m benchmarks.bench_parse --corpus responses.jsonl
+
+Without --corpus, a synthetic corpus mixing clean, fenced, truncated,
+single-quoted and partly malformed responses is used.
+"""
+
+import argparse
+import ast
+import json
+import random
+import time
+
+from triplet_parser import parse_triplet_output
+
+
+def legacy_parse(raw_output):
+    """The parser TripletExtractor used before triplet_parser, minus its prints."""
+    cleaned = (
+        raw_output.replace("```json", "")
+        .replace("```", "")
+        .replace("\n", "")
+        .strip()
+    )
+    try:
+        triplet_list = ast.literal_eval(cleaned)
+    except Exception:
+        return []
+    return [t for t in triplet_list if isinstance(t, list) and len(t) == 5]
+
+
+def synthetic_corpus(n, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(n):
+        triplets = [
+            [f"Entity {i}-{k}", "organization", "part_of", f"Ministry {k}", "ministry"]
+            for k in range(rng.randint(3, 12))
+        ]
+        text = "[\n" + ",\n".join(json.dumps(t) for t in triplets) + "\n]"
+        kind = rng.choice(["clean", "fenced", "truncated", "quotes", "junk", "prose"])
+        if kind == "fenced":
+            text = f"```json\n{text}\n```"
+        elif kind == "truncated":
+            text = text[: rng.randint(len(text) // 2, len(text) - 2)]
+        elif kind == "quotes":
+            text = text.replace('"', "'")
+        elif kind == "junk":
+            cut = rng.randint(1, len(text) - 1)
+            text = text[:cut] + rng.choice(["`", "}", "\\", ";"]) + text[cut:]
+        elif kind == "prose":
+            text = "Here are the extracted relationships:\n" + text
+        corpus.append(text)
+    return corpus
+
+
+def measure(parse, corpus, repeat):
+    recovered = sum(len(parse(raw)) for raw in corpus)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for raw in corpus:
+            parse(raw)
+    elapsed = time.perf_counter() - start
+    return recovered, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", help="JSON lines file of raw responses")
+    parser.add_argument("--responses", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.corpus:
+        with open(args.corpus, encoding="utf-8") as f:
+            corpus = [json.loads(line) for line in f if line.strip()]
+    else:
+        corpus = synthetic_corpus(args.responses)
+    size_mb = sum(len(raw) for raw in corpus) * args.repeat / 1e6
+
+    print(f"{len(corpus)} responses, {size_mb / args.repeat:.2f} MB")
+    print(f"{'parser':<10}{'responses/s':>14}{'MB/s':>10}{'triplets':>10}")
+    for name, parse in (("legacy", legacy_parse), ("salvage", parse_triplet_output)):
+        recovered, elapsed = measure(parse, corpus, args.repeat)
+        rate = len(corpus) * args.repeat / elapsed
+        print(f"{name:<10}{rate:>14.0f}{size_mb / elapsed:>10.2f}{recovered:>10}")
+
+
+if __name__ == "__main__":
+    main()
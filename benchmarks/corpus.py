@@ -0,0 +1,180 @@
+"""
+Synthetic PDF corpora shaped like the government documents in data/: sections of
+prose naming ministries, departments, schemes, officials and places, with a
+running header, a disclaimer and a page-numbered footer on every page.
+
+    python -m benchmarks.corpus --size medium --out bench_corpus
+"""
+
+import argparse
+import random
+from pathlib import Path
+
+import fitz
+
+# (documents, average pages per document)
+SIZES = {"small": (5, 4), "medium": (20, 10), "large": (50, 30)}
+
+MINISTRIES = [
+    "Ministry of Finance",
+    "Ministry of Health",
+    "Ministry of Education",
+    "Ministry of Transport",
+    "Ministry of Agriculture",
+    "Ministry of Housing",
+    "Ministry of Justice",
+    "Ministry of Energy",
+]
+DEPARTMENTS = [
+    "Department of Revenue",
+    "Department of Public Expenditure",
+    "Department of Higher Education",
+    "Department of Rural Development",
+    "Department of Social Protection",
+    "Office of Public Works",
+    "National Audit Office",
+    "Central Statistics Office",
+]
+SCHEMES = [
+    "Rural Broadband Scheme",
+    "Green Homes Grant",
+    "School Meals Programme",
+    "Regional Transport Fund",
+    "Farm Resilience Scheme",
+    "Primary Care Initiative",
+    "Affordable Housing Fund",
+    "Skills Development Programme",
+]
+PEOPLE = [
+    "Mary Walsh",
+    "John Byrne",
+    "Aisha Khan",
+    "David Murphy",
+    "Sofia Rossi",
+    "Liam Doyle",
+    "Grace Okafor",
+    "Peter Novak",
+]
+ROLES = ["Secretary General", "Chief Executive", "Director", "Minister"]
+PLACES = ["Dublin", "Cork", "Galway", "Limerick", "Waterford", "Sligo", "Kilkenny"]
+
+SENTENCES = [
+    "{ministry} is responsible for the {scheme}.",
+    "{person}, {role} of the {department}, reported to the {ministry} in {year}.",
+    "{department} allocated {amount} million to the {scheme} for {year}.",
+    "Funding under the {scheme} is administered by the {department} in {place}.",
+    "{ministry} published the annual review of the {scheme} in {place}.",
+    "{person} chairs the steering group of the {scheme}.",
+    "{department} operates under the aegis of the {ministry}.",
+    "progress against these targets is reviewed every quarter and summarised "
+    "in the statement of strategy.",
+    "expenditure figures are provisional and may be revised once accounts "
+    "are finalised.",
+    "applications are assessed against published criteria and decisions are "
+    "notified in writing.",
+]
+HEADINGS = [
+    "Overview",
+    "Governance",
+    "Funding",
+    "Programme Delivery",
+    "Performance",
+    "Outlook",
+]
+DISCLAIMER = (
+    "This document is published for information purposes only and does not "
+    "constitute legal advice."
+)
+
+
+def sentence(rng):
+    return rng.choice(SENTENCES).format(
+        ministry=rng.choice(MINISTRIES),
+        department=rng.choice(DEPARTMENTS),
+        scheme=rng.choice(SCHEMES),
+        person=rng.choice(PEOPLE),
+        role=rng.choice(ROLES),
+        place=rng.choice(PLACES),
+        year=rng.randint(2015, 2025),
+        amount=rng.randint(2, 900),
+    )
+
+
+def page_text(rng, words=450):
+    paragraphs, count = [], 0
+    while count < words:
+        paragraph = " ".join(sentence(rng) for _ in range(rng.randint(3, 6)))
+        paragraph = paragraph[0].upper() + paragraph[1:]
+        if rng.random() < 0.3:
+            paragraph = f"{rng.choice(HEADINGS)}\n{paragraph}"
+        paragraphs.append(paragraph)
+        count += len(paragraph.split())
+    return "\n\n".join(paragraphs)
+
+
+def write_pdf(path, title, pages, rng):
+    doc = fitz.open()
+    for number in range(1, pages + 1):
+        page = doc.new_page(width=595, height=842)
+        page.insert_text((50, 40), title, fontsize=9)
+        page.insert_textbox(fitz.Rect(50, 60, 545, 770), page_text(rng), fontsize=9)
+        page.insert_textbox(fitz.Rect(50, 780, 545, 800), DISCLAIMER, fontsize=7)
+        page.insert_text((50, 815), f"{title} - Page {number} of {pages}", fontsize=7)
+    doc.save(str(path))
+    doc.close()
+
+
+def make_corpus(out_dir, documents, pages, seed=0):
+    """
+    Write `documents` PDFs of about `pages` pages each (0.5x to 1.5x) to
+    `out_dir` and return their paths. The same arguments give the same files,
+    and files already present are reused.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(documents):
+        rng = random.Random(f"{seed}:{i}")
+        count = rng.randint(max(1, pages // 2), max(1, pages * 3 // 2))
+        path = out_dir / f"report-{seed}-{i:03d}-{count}p.pdf"
+        if not path.exists():
+            title = f"{rng.choice(MINISTRIES)} Annual Report {2015 + i % 11}"
+            write_pdf(path, title, count, rng)
+        paths.append(path)
+    return paths
+
+
+def questions(n, seed=0):
+    """`n` questions about the entities the corpus mentions."""
+    rng = random.Random(seed)
+    templates = [
+        "Which schemes is the {ministry} responsible for?",
+        "Who reported to the {ministry}?",
+        "How much funding did the {department} allocate to the {scheme}?",
+        "Who chairs the steering group of the {scheme}?",
+        "Where is the {scheme} administered?",
+    ]
+    return [
+        rng.choice(templates).format(
+            ministry=rng.choice(MINISTRIES),
+            department=rng.choice(DEPARTMENTS),
+            scheme=rng.choice(SCHEMES),
+        )
+        for _ in range(n)
+    ]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic PDF corpus.")
+    parser.add_argument("--size", choices=SIZES, default="small")
+    parser.add_argument("--documents", type=int, help="Overrides --size")
+    parser.add_argument("--pages", type=int, help="Overrides --size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_corpus")
+    args = parser.parse_args()
+
+    documents, pages = SIZES[args.size]
+    paths = make_corpus(
+        args.out, args.documents or documents, args.pages or pages, args.seed
+    )
+    print(f"✅ {len(paths)} PDFs in {args.out}")
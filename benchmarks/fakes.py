@@ -0,0 +1,326 @@
+"""
+Local stand-ins for OpenAI embeddings, the chat model and the Neo4j driver, so the
+pipeline can be timed without network services. Run benchmarks from the repository
+root, e.g. `python -m benchmarks.bench_ingest`.
+"""
+
+import asyncio
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+from collections import Counter
+
+import numpy as np
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class FakeAPIError(Exception):
+    """A rate-limit response; `is_retryable` treats it like OpenAI's 429."""
+
+    status_code = 429
+
+
+class FakeEmbeddings:
+    """
+    Deterministic embeddings with a fixed latency per API call; `failure_rate` of
+    calls raise FakeAPIError after the latency.
+    """
+
+    def __init__(self, dim=1536, latency=0.05, failure_rate=0.0, seed=0):
+        self.dim = dim
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.failure_rate
+            self.failures += failed
+        time.sleep(self.latency)
+        if failed:
+            raise FakeAPIError("fake embeddings: rate limited")
+
+    def _vector(self, text):
+        out = []
+        seed = text.encode("utf-8")
+        counter = 0
+        while len(out) < self.dim:
+            digest = hashlib.sha256(seed + struct.pack("<I", counter)).digest()
+            out.extend(b / 255.0 - 0.5 for b in digest)
+            counter += 1
+        return out[: self.dim]
+
+    def embed_query(self, text):
+        self._call()
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        self._call()
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text):
+        return await asyncio.to_thread(self.embed_query, text)
+
+
+_PACKED_CHUNK = re.compile(
+    r"### CHUNK (\d+)\n(.*?)(?=\n\n### CHUNK |\noutput:)", re.S
+)
+_SINGLE_CHUNK = re.compile(r"```(.*?)```\noutput:", re.S)
+_QUESTION_CONTEXT = re.compile(r"Context:\s*(.*?)\s*Answer:\s*$", re.S)
+_NAME = re.compile(r"(?!The\b)[A-Z][A-Za-z]+(?: (?:of |for |and )?[A-Z][A-Za-z]+)*")
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Answers TripletExtractor prompts (single or packed) with one triplet per
+    sentence naming two capitalised names, and SemanticAgent prompts with the
+    start of the context. Each request costs `latency` seconds plus
+    `token_latency` per completion token; `malformed_rate` of packed responses
+    come back truncated and `failure_rate` of requests raise FakeAPIError.
+    Token counts use ~4 characters per token.
+    """
+
+    model_name: str = "fake-chat"
+    latency: float = 0.5
+    token_latency: float = 0.0
+    malformed_rate: float = 0.0
+    failure_rate: float = 0.0
+    seed: int = 0
+    calls: int = 0
+    failures: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    rng: random.Random = None
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    @staticmethod
+    def triplets(text):
+        out = []
+        for sentence in text.split(". "):
+            names = _NAME.findall(sentence)
+            if len(names) >= 2:
+                out.append(
+                    [names[0], "organization", "part_of", names[1], "organization"]
+                )
+        return out
+
+    def _respond(self, prompt):
+        if self.rng is None:
+            self.rng = random.Random(self.seed)
+        if self.rng.random() < self.failure_rate:
+            self.failures += 1
+            raise FakeAPIError("fake chat model: rate limited")
+        packed = _PACKED_CHUNK.findall(prompt)
+        question = _QUESTION_CONTEXT.search(prompt)
+        if packed:
+            content = json.dumps({n: self.triplets(text) for n, text in packed})
+            if self.rng.random() < self.malformed_rate:
+                content = content[: len(content) // 2]
+        elif question:
+            content = "According to the documents, " + question.group(1)[:300]
+        else:
+            match = _SINGLE_CHUNK.search(prompt)
+            content = json.dumps(self.triplets(match.group(1) if match else ""))
+        self.calls += 1
+        self.prompt_tokens += len(prompt) // 4
+        self.completion_tokens += len(content) // 4
+        delay = self.latency + self.token_latency * (len(content) // 4)
+        return content, delay
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        content, delay = self._respond(messages[-1].content)
+        time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        content, delay = self._respond(messages[-1].content)
+        await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content))])
+
+
+class StubResult(list):
+    def single(self):
+        return self[0] if self else None
+
+    def consume(self):
+        return None
+
+
+class StubTx:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def run(self, query, parameters=None, **kwargs):
+        self.driver.round_trips += 1
+        time.sleep(self.driver.latency)
+        self.driver.queries.append(query)
+        return StubResult(self.driver.execute(query, dict(parameters or {}, **kwargs)))
+
+
+class StubSession:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        pass
+
+    def run(self, query, parameters=None, **kwargs):
+        return StubTx(self.driver).run(query, parameters, **kwargs)
+
+    def execute_write(self, fn, *args, **kwargs):
+        return fn(StubTx(self.driver), *args, **kwargs)
+
+    def execute_read(self, fn, *args, **kwargs):
+        return fn(StubTx(self.driver), *args, **kwargs)
+
+
+class StubDriver:
+    """Counts Cypher round-trips and charges a fixed latency for each one."""
+
+    def __init__(self, latency=0.002):
+        self.latency = latency
+        self.round_trips = 0
+        self.queries = []
+
+    def session(self, **kwargs):
+        return StubSession(self)
+
+    def execute(self, query, params):
+        """Rows returned for `query`; the stub answers everything with none."""
+        return []
+
+    def close(self):
+        pass
+
+
+_ENTITY = re.compile(r"MERGE \((a|b):`?(\w+)`? \{name: row\.[so]\}\)")
+_RELATION = re.compile(r"MERGE \(a\)-\[:`?(\w+)`?\]->\(b\)")
+
+
+class MemoryDriver(StubDriver):
+    """
+    In-memory graph for the statements the pipeline sends: chunk writes from
+    DocumentIngestor, triplet writes from TripletExtractor and SemanticAgent's
+    single-query retrieval (vector index or local hits). Other statements, such as
+    schema DDL, are counted and return no rows. Vector search is exact cosine
+    similarity, scored like a Neo4j cosine index.
+    """
+
+    def __init__(self, latency=0.002):
+        super().__init__(latency)
+        self.chunks = {}  # chunk_id -> text
+        self.vectors = {}  # chunk_id -> unit embedding
+        self.mentions = {}  # chunk_id -> {(label, name)}
+        self.facts = {}  # (label, name) -> {(rel_type, (label, name))}
+        self.degree = Counter()
+        self._edges = set()
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def execute(self, query, params):
+        with self._lock:
+            if "ON CREATE SET c.text" in query:
+                return self._write_chunks(params["rows"])
+            if "MERGE (a:" in query:
+                return self._write_triplets(query, params["rows"])
+            if "RETURN c.chunk_id AS cid, c.text AS chunk, score, mentions" in query:
+                if "$hits" in query:
+                    hits = [(h["cid"], h["score"]) for h in params["hits"]]
+                else:
+                    hits = self._search(params["embedding"], params["topK"])
+                return self._retrieve(hits, params["maxNeighbors"])
+        return []
+
+    def _edge(self, src, rel_type, dst):
+        if (src, rel_type, dst) not in self._edges:
+            self._edges.add((src, rel_type, dst))
+            self.degree[src] += 1
+            self.degree[dst] += 1
+
+    def _write_chunks(self, rows):
+        for row in rows:
+            if row["chunk_id"] in self.vectors:
+                continue
+            vector = np.asarray(row["embedding"], dtype=np.float32)
+            self.chunks[row["chunk_id"]] = row["text"]
+            self.vectors[row["chunk_id"]] = vector / max(np.linalg.norm(vector), 1e-9)
+            self._matrix = None
+        return []
+
+    def _write_triplets(self, query, rows):
+        labels = dict(_ENTITY.findall(query))
+        relation = _RELATION.search(query)
+        for row in rows:
+            chunk = ("Chunk", row["chunk_id"])
+            a, b = (labels["a"], row["s"]), (labels["b"], row["o"])
+            if relation:
+                self.facts.setdefault(a, set()).add((relation.group(1), b))
+                self._edge(a, relation.group(1), b)
+            for entity in (a, b):
+                self.mentions.setdefault(row["chunk_id"], set()).add(entity)
+                self._edge(chunk, "MENTIONS", entity)
+        return []
+
+    def _search(self, embedding, top_k):
+        if not self.vectors:
+            return []
+        if self._matrix is None:
+            self._ids = list(self.vectors)
+            self._matrix = np.stack([self.vectors[cid] for cid in self._ids])
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = self._matrix @ (query / max(np.linalg.norm(query), 1e-9))
+        best = np.argsort(-scores)[:top_k]
+        return [(self._ids[i], float((1 + scores[i]) / 2)) for i in best]
+
+    def _retrieve(self, hits, max_neighbors):
+        rows = []
+        for cid, score in hits:
+            if cid not in self.chunks:
+                continue
+            mentions = []
+            for entity in sorted(self.mentions.get(cid, ()), key=lambda e: e[1]):
+                facts = sorted(
+                    self.facts.get(entity, ()), key=lambda f: (f[0], f[1][1])
+                )
+                mentions.append(
+                    {
+                        "name": entity[1],
+                        "label": entity[0],
+                        "degree": self.degree[entity],
+                        "facts": [
+                            {"rel_type": rel, "name": n[1], "label": n[0]}
+                            for rel, n in facts[:max_neighbors]
+                        ],
+                    }
+                )
+            rows.append(
+                {
+                    "cid": cid,
+                    "chunk": self.chunks[cid],
+                    "score": score,
+                    "mentions": mentions,
+                }
+            )
+        rows.sort(key=lambda r: (-r["score"], r["cid"]))
+        return rows
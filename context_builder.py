@@ -0,0 +1,158 @@
+import logging
+import math
+import re
+
+FACTS_HEADER = "Additional facts from knowledge graph:\n"
+SECTION_SEPARATOR = "\n\n---\n\n"
+
+_WORD = re.compile(r"\w+")
+
+
+def compose_context(chunks, chunk_to_mentions, expansion_triples):
+    """Format chunks, their mentions and expansion facts into the prompt context."""
+    context_sections = [
+        chunk_section(c, chunk_to_mentions.get(c["id"], [])) for c in chunks
+    ]
+    # At the end: All expanded facts
+    if expansion_triples:
+        context_sections.append(FACTS_HEADER + "\n".join(expansion_triples))
+    return SECTION_SEPARATOR.join(context_sections)
+
+
+def chunk_section(chunk, mentions):
+    section = chunk["text"] + "\nMentions in this chunk:"
+    if mentions:
+        for m in mentions:
+            section += f"\n- {m}"
+    else:
+        section += "\n- (none)"
+    return section
+
+
+def _terms(text):
+    return {w for w in _WORD.findall(text.lower()) if len(w) > 2}
+
+
+class TokenCounter:
+    """tiktoken counts for `model`, or a ~4 chars/token estimate if unavailable."""
+
+    def __init__(self, model="gpt-4.1-nano"):
+        self._encoding = None
+        try:
+            import tiktoken
+
+            try:
+                self._encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self._encoding = tiktoken.get_encoding("o200k_base")
+        except Exception as e:
+            logging.warning(f"tiktoken unavailable, estimating token counts: {e}")
+
+    def __call__(self, text):
+        if self._encoding is None:
+            return len(text) // 4 + 1
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class ContextBuilder:
+    """
+    Packs retrieved chunks and graph facts into a token budget.
+
+    Every chunk section and expansion fact is scored as
+
+        retrieval * w_retrieval + question overlap * w_overlap
+            + specificity * w_degree
+
+    where retrieval is the vector score (a fact inherits the best score of the
+    chunks mentioning its entity), question overlap is the share of question terms
+    found in the item, and specificity is 1 / log2(2 + degree) of the fact's
+    entity, so facts about hub entities rank lower. Items are then added
+    greedily, best first, while they fit in `token_budget`.
+    """
+
+    def __init__(
+        self,
+        token_budget=4000,
+        model="gpt-4.1-nano",
+        w_retrieval=1.0,
+        w_overlap=0.5,
+        w_degree=0.2,
+    ):
+        self.token_budget = token_budget
+        self.count_tokens = TokenCounter(model)
+        self.w_retrieval = w_retrieval
+        self.w_overlap = w_overlap
+        self.w_degree = w_degree
+
+    def _overlap(self, q_terms, text):
+        if not q_terms:
+            return 0.0
+        return len(q_terms & _terms(text)) / len(q_terms)
+
+    def build(
+        self, question, chunks, chunk_to_mentions, expansion_triples, fact_meta=None
+    ):
+        """
+        Return (context, stats). `fact_meta` maps a fact string to
+        {"score": ..., "degree": ...}; stats reports full vs packed token counts.
+        """
+        fact_meta = fact_meta or {}
+        full = compose_context(chunks, chunk_to_mentions, expansion_triples)
+        full_tokens = self.count_tokens(full)
+        stats = {
+            "full_tokens": full_tokens,
+            "tokens": full_tokens,
+            "saved_tokens": 0,
+            "chunks": f"{len(chunks)}/{len(chunks)}",
+            "facts": f"{len(expansion_triples)}/{len(expansion_triples)}",
+        }
+        if self.token_budget is None or full_tokens <= self.token_budget:
+            return full, stats
+
+        q_terms = _terms(question)
+        sep_tokens = self.count_tokens(SECTION_SEPARATOR)
+        candidates = []  # (score, kind, position, cost)
+        n = len(chunks)
+        for rank, c in enumerate(chunks):
+            # Legacy retrieval has no scores; fall back to rank order.
+            retrieval = c.get("score", 1 - rank / max(n, 1))
+            section = chunk_section(c, chunk_to_mentions.get(c["id"], []))
+            score = self.w_retrieval * retrieval + self.w_overlap * self._overlap(
+                q_terms, section
+            )
+            cost = self.count_tokens(section) + sep_tokens
+            candidates.append((score, "chunk", rank, cost))
+        default_score = min((c.get("score", 0.0) for c in chunks), default=0.0)
+        for pos, fact in enumerate(expansion_triples):
+            meta = fact_meta.get(fact, {})
+            specificity = 1 / math.log2(2 + meta.get("degree", 0))
+            score = (
+                self.w_retrieval * meta.get("score", default_score)
+                + self.w_overlap * self._overlap(q_terms, fact)
+                + self.w_degree * specificity
+            )
+            candidates.append((score, "fact", pos, self.count_tokens(fact) + 1))
+
+        remaining = self.token_budget - self.count_tokens(FACTS_HEADER) - sep_tokens
+        kept_chunks, kept_facts = set(), set()
+        for score, kind, pos, cost in sorted(
+            candidates, key=lambda c: (-c[0], c[1], c[2])
+        ):
+            if cost > remaining:
+                continue
+            remaining -= cost
+            (kept_chunks if kind == "chunk" else kept_facts).add(pos)
+
+        packed = compose_context(
+            [c for i, c in enumerate(chunks) if i in kept_chunks],
+            chunk_to_mentions,
+            [f for i, f in enumerate(expansion_triples) if i in kept_facts],
+        )
+        tokens = self.count_tokens(packed)
+        stats.update(
+            tokens=tokens,
+            saved_tokens=full_tokens - tokens,
+            chunks=f"{len(kept_chunks)}/{len(chunks)}",
+            facts=f"{len(kept_facts)}/{len(expansion_triples)}",
+        )
+        return packed, stats
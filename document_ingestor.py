@@ -1,52 +1,323 @@
 import os
 import logging
+from itertools import islice
 from pathlib import Path
 
-from langchain_community.document_loaders import PyMuPDFLoader
+import fitz
+from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from neo4j import GraphDatabase
 
+import telemetry
+from answer_cache import invalidate_chunks
+from embedding_cache import CachedEmbeddings, text_key
+
 logging.basicConfig(level=logging.INFO)
 
 
+def _assign_chunk_id(chunk, doc_id, idx, seen):
+    text_hash = text_key(chunk.page_content)
+    seen[text_hash] = seen.get(text_hash, 0) + 1
+    suffix = f"-{seen[text_hash]}" if seen[text_hash] > 1 else ""
+    chunk.metadata["chunk_id"] = f"{doc_id}:{text_hash[:16]}{suffix}"
+    chunk.metadata["chunk_index"] = idx
+    chunk.metadata["text_hash"] = text_hash
+
+
+def assign_chunk_ids(chunks, doc_id):
+    """
+    Give each chunk a content-addressed id, `doc_id:<text hash prefix>`, so an
+    unchanged chunk keeps its id when the surrounding PDF is edited. Repeated text
+    within a document gets a `-2`, `-3`, ... suffix.
+    """
+    seen = {}
+    for idx, chunk in enumerate(chunks):
+        _assign_chunk_id(chunk, doc_id, idx, seen)
+    return chunks
+
+
+def page_count(pdf_path):
+    with fitz.open(str(pdf_path)) as pdf:
+        return pdf.page_count
+
+
+def iter_pages(pdf_path, start=0, stop=None):
+    """Yield (page number, text) for pages [start, stop), one page at a time."""
+    with fitz.open(str(pdf_path)) as pdf:
+        stop = pdf.page_count if stop is None else min(stop, pdf.page_count)
+        for number in range(start, stop):
+            yield number, pdf[number].get_text()
+
+
+def split_pages(chunker, pdf_path, start, stop, last):
+    """
+    Feed pages [start, stop) to `chunker`, closing it after the last window; lets
+    worker processes parse and split a PDF in windows. Returns (chunker, pages
+    read, chunks), so the caller passes the chunker on to the next window.
+    """
+    pages, chunks = 0, []
+    for number, text in iter_pages(pdf_path, start, stop):
+        pages += 1
+        chunks += chunker.feed(number, text)
+    if last:
+        chunks += chunker.close()
+    return chunker, pages, chunks
+
+
+class PageChunker:
+    """
+    Splits a document page by page. `feed` returns the chunks completed so far
+    and carries the text of the last, still growing chunk over to the next page,
+    so chunks and their overlap run across page boundaries; `close` returns the
+    rest. Memory is bounded by one page plus one chunk, and chunks get the same
+    content-addressed ids as `assign_chunk_ids`.
+    """
+
+    def __init__(self, doc_id, source=None, chunk_size=500, chunk_overlap=100):
+        self.doc_id = doc_id
+        self.source = source
+        self.splitter = RecursiveCharacterTextSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap, add_start_index=True
+        )
+        self._buffer = ""
+        self._pages = []  # (offset in buffer, page number)
+        self._seen = {}
+        self._index = 0
+
+    def feed(self, number, text):
+        # A line break, not a paragraph break, so the splitter may join pages.
+        if self._buffer and not self._buffer.endswith("\n"):
+            self._buffer += "\n"
+        self._pages.append((len(self._buffer), number))
+        self._buffer += text
+        return self._split(final=False)
+
+    def close(self):
+        return self._split(final=True)
+
+    def _split(self, final):
+        docs = self.splitter.create_documents([self._buffer])
+        keep_from = len(self._buffer)
+        if not final:
+            # The last chunk may still grow with the next page.
+            if len(docs) < 2:
+                return []
+            last = docs.pop()
+            keep_from = last.metadata["start_index"]
+            if keep_from < 0:
+                keep_from = self._buffer.rfind(last.page_content)
+        chunks = []
+        for doc in docs:
+            start = doc.metadata["start_index"]
+            page = next(
+                (n for offset, n in reversed(self._pages) if offset <= start),
+                self._pages[0][1],
+            )
+            chunk = Document(
+                page_content=doc.page_content,
+                metadata={"source": self.source, "page": page},
+            )
+            _assign_chunk_id(chunk, self.doc_id, self._index, self._seen)
+            self._index += 1
+            chunks.append(chunk)
+        self._buffer = self._buffer[keep_from:]
+        pages = [(offset - keep_from, n) for offset, n in self._pages]
+        # Keep the page the carried text starts on and every page after it.
+        first = max((i for i, (off, _) in enumerate(pages) if off <= 0), default=0)
+        self._pages = [(max(offset, 0), n) for offset, n in pages[first:]]
+        if final:
+            self._pages = []
+        return chunks
+
+
+def iter_pdf_chunks(pdf_path, doc_id, chunk_size=500, chunk_overlap=100):
+    """Lazily parse and split a PDF; yields chunks as each page completes them."""
+    chunker = PageChunker(doc_id, str(pdf_path), chunk_size, chunk_overlap)
+    for number, text in iter_pages(pdf_path):
+        yield from chunker.feed(number, text)
+    yield from chunker.close()
+
+
+def split_pdf(pdf_path, doc_id, chunk_size=500, chunk_overlap=100):
+    """Parse a PDF and split it into chunks with stable, content-addressed ids."""
+    with telemetry.span("parse", doc_id=doc_id) as span:
+        chunks = list(iter_pdf_chunks(pdf_path, doc_id, chunk_size, chunk_overlap))
+        span.set(chunks=len(chunks))
+    return chunks
+
+
 class DocumentIngestor:
     """
     Loads a PDF, splits into overlapping chunks, computes embeddings, and writes nodes to Neo4j.
     """
 
     def __init__(
-        self, pdf_path, doc_id, neo4j_uri=None, neo4j_user=None, neo4j_pwd=None
+        self,
+        pdf_path,
+        doc_id,
+        neo4j_uri=None,
+        neo4j_user=None,
+        neo4j_pwd=None,
+        embed_batch_size=64,
+        write_batch_size=256,
+        driver=None,
+        embedder=None,
+        vector_index=None,
     ):
         self.pdf_path = pdf_path
         self.doc_id = doc_id
         self.neo4j_uri = neo4j_uri or os.environ.get("NEO4J_URI")
         self.neo4j_user = os.environ.get("NEO4J_USERNAME")
         self.neo4j_pwd = os.environ.get("NEO4J_PASSWORD")
-        self.driver = GraphDatabase.driver(
+        # Number of chunks sent per embed_documents call / per UNWIND write.
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.driver = driver or GraphDatabase.driver(
             self.neo4j_uri, auth=(self.neo4j_user, self.neo4j_pwd)
         )
-        self.embedder = OpenAIEmbeddings(model="text-embedding-3-small")
+        self.embedder = embedder or CachedEmbeddings(
+            OpenAIEmbeddings(model="text-embedding-3-small")
+        )
+        # Optional LocalVectorIndex kept in step with the Chunk nodes we write.
+        self.vector_index = vector_index
 
     def load_chunks(self, chunk_size=500, chunk_overlap=100):
-        loader = PyMuPDFLoader(str(self.pdf_path))
-        docs = loader.load()
-        splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        return split_pdf(self.pdf_path, self.doc_id, chunk_size, chunk_overlap)
+
+    def iter_chunks(self, chunk_size=500, chunk_overlap=100):
+        return iter_pdf_chunks(self.pdf_path, self.doc_id, chunk_size, chunk_overlap)
+
+    def _chunk_id(self, chunk, idx):
+        return chunk.metadata.get("chunk_id") or f"{self.doc_id}:{idx}"
+
+    def ingest(self, chunks=None, batched=True, on_written=None):
+        """
+        Embed and write chunks to Neo4j. In batched mode (the default) chunks are
+        embedded `embed_batch_size` at a time through `embed_documents` and written
+        `write_batch_size` rows per `UNWIND` transaction; `batched=False` keeps the
+        original one-embedding, one-MERGE-per-chunk path for comparison.
+        `on_written` is called with the chunk ids of each committed transaction.
+
+        `chunks` may be any iterable. By default the PDF is streamed through
+        `iter_chunks`, so memory does not grow with the document and the first
+        rows are written once `write_batch_size` chunks have been parsed.
+        Returns the number of chunks ingested.
+        """
+        if chunks is None:
+            chunks = self.iter_chunks()
+            logging.info(f"Streaming chunks from {self.pdf_path}")
+        with telemetry.span("ingest", doc_id=self.doc_id) as span:
+            if not batched:
+                count = self._ingest_sequential(list(chunks))
+            else:
+                count = self._ingest_batched(chunks, on_written)
+            span.set(chunks=count)
+        return count
+
+    def _ingest_batched(self, chunks, on_written=None):
+        chunks = iter(chunks)
+        with self.driver.session() as session:
+            rows = []
+            written = 0
+            start = 0
+            while True:
+                batch = list(islice(chunks, self.embed_batch_size))
+                if not batch:
+                    break
+                texts = [chunk.page_content for chunk in batch]
+                with telemetry.span("ingest.embed", texts=len(texts)):
+                    embeddings = self.embedder.embed_documents(texts)
+                telemetry.count("embedding_requests", stage="ingest")
+                for offset, (chunk, emb) in enumerate(zip(batch, embeddings)):
+                    rows.append(
+                        {
+                            "chunk_id": self._chunk_id(chunk, start + offset),
+                            "text": chunk.page_content,
+                            "embedding": emb,
+                        }
+                    )
+                start += len(batch)
+                while len(rows) >= self.write_batch_size:
+                    batch_rows = rows[: self.write_batch_size]
+                    self._write_rows(session, batch_rows, on_written)
+                    rows = rows[self.write_batch_size :]
+                    written += self.write_batch_size
+                    logging.info(f"Ingested chunk {written}")
+            if rows:
+                self._write_rows(session, rows, on_written)
+                written += len(rows)
+                logging.info(f"Ingested chunk {written}")
+        logging.info(f"Successfully ingested all {written} chunks into Neo4j.")
+        return written
+
+    def _write_rows(self, session, rows, on_written=None):
+        with telemetry.span("ingest.write", rows=len(rows)):
+            session.execute_write(self._write_chunk_rows, rows)
+        telemetry.count("db_round_trips", stage="ingest")
+        invalidate_chunks(row["chunk_id"] for row in rows)
+        if self.vector_index is not None:
+            self.vector_index.append(
+                [row["chunk_id"] for row in rows], [row["embedding"] for row in rows]
+            )
+        if on_written is not None:
+            on_written([row["chunk_id"] for row in rows])
+
+    def _write_chunk_rows(self, tx, rows):
+        tx.run(
+            """
+            MERGE (d:Document {source_id: $doc_id})
+            WITH d
+            UNWIND $rows AS row
+            MERGE (c:Chunk {chunk_id: row.chunk_id})
+                ON CREATE SET c.text = row.text, c.embedding = row.embedding
+            MERGE (d)-[:HAS_CHUNK]->(c)
+            """,
+            doc_id=self.doc_id,
+            rows=rows,
         )
-        chunks = splitter.split_documents(docs)
-        for idx, chunk in enumerate(chunks):
-            chunk.metadata["chunk_id"] = f"{self.doc_id}:{idx}"
-        return chunks
 
-    def ingest(self):
-        chunks = self.load_chunks()
-        logging.info(f"Loaded {len(chunks)} chunks from {self.pdf_path}")
+    def graph_chunk_ids(self):
+        """Ids of this document's Chunk nodes currently in the graph."""
+        with self.driver.session() as session:
+            chunk_ids = session.run(
+                """
+                MATCH (:Document {source_id: $doc_id})-[:HAS_CHUNK]->(c:Chunk)
+                RETURN c.chunk_id
+                """,
+                doc_id=self.doc_id,
+            ).value()
+        telemetry.count("db_round_trips", stage="ingest")
+        return chunk_ids
+
+    def delete_chunks(self, chunk_ids):
+        """Remove Chunk nodes together with their HAS_CHUNK and MENTIONS edges."""
+        if not chunk_ids:
+            return
+        with self.driver.session() as session:
+            session.run(
+                """
+                UNWIND $chunk_ids AS cid
+                MATCH (c:Chunk {chunk_id: cid})
+                DETACH DELETE c
+                """,
+                chunk_ids=list(chunk_ids),
+            ).consume()
+        telemetry.count("db_round_trips", stage="ingest")
+        invalidate_chunks(chunk_ids)
+        if self.vector_index is not None:
+            self.vector_index.remove(chunk_ids)
+        logging.info(f"Removed {len(chunk_ids)} stale chunks of {self.doc_id}")
+
+    def _ingest_sequential(self, chunks):
         with self.driver.session() as session:
             for i, chunk in enumerate(chunks):
                 text = chunk.page_content  # <--- FIX: get the text from the Document
-                chunk_id = f"{self.doc_id}:{i}"
-                emb = self.embedder.embed_query(text)
+                chunk_id = self._chunk_id(chunk, i)
+                with telemetry.span("ingest.embed", texts=1):
+                    emb = self.embedder.embed_query(text)
+                telemetry.count("embedding_requests", stage="ingest")
+                telemetry.count("db_round_trips", stage="ingest")
                 session.run(
                     """
                     MERGE (d:Document {source_id: $doc_id})
@@ -62,6 +333,7 @@ class DocumentIngestor:
                 if i % 10 == 0 or i == len(chunks) - 1:
                     logging.info(f"Ingested chunk {i+1}/{len(chunks)}")
         logging.info(f"Successfully ingested all {len(chunks)} chunks into Neo4j.")
+        return len(chunks)
 
 
 if __name__ == "__main__":
@@ -74,11 +346,19 @@ if __name__ == "__main__":
     parser.add_argument(
         "--doc_id", type=str, required=True, help="Unique document ID for this PDF"
     )
+    parser.add_argument(
+        "--embed_batch_size", type=int, default=64, help="Chunks per embedding call"
+    )
+    parser.add_argument(
+        "--write_batch_size", type=int, default=256, help="Chunks per Neo4j write"
+    )
     args = parser.parse_args()
 
     ingestor = DocumentIngestor(
         pdf_path=args.pdf_path,
         doc_id=args.doc_id,
+        embed_batch_size=args.embed_batch_size,
+        write_batch_size=args.write_batch_size,
         # Optionally: neo4j_uri=..., neo4j_user=..., neo4j_pwd=...
     )
     ingestor.ingest()
@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+DEFAULT_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+DEFAULT_MODEL = "text-embedding-3-small"
+
+
+def text_key(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent embedding store keyed by (model, sha256(text)).
+
+    Vectors are kept in SQLite as float32 blobs, with an in-process LRU in front of
+    it. When the stored vectors exceed `max_bytes`, the least recently used rows are
+    evicted; LRU hits count as uses too and are written to `last_used` in batches
+    of `touch_batch`. `hits` / `misses` count lookups across both layers.
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_CACHE_PATH,
+        lru_size=4096,
+        max_bytes=2 * 1024**3,
+        touch_batch=256,
+    ):
+        self.path = str(path)
+        self.lru_size = lru_size
+        self.max_bytes = max_bytes
+        self.touch_batch = touch_batch
+        self.hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        # LRU hits whose last_used is not yet updated in SQLite
+        self._touched = {}
+        # Bytes of stored vectors, summed once and then kept up to date
+        self._size = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+
+    def _remember(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def get_many(self, model, texts):
+        """Return a list aligned with `texts`; missing entries are None."""
+        keys = [(model, text_key(t)) for t in texts]
+        found = {}
+        with self._lock:
+            pending = []
+            for key in keys:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+                    self._touched[key] = None
+                elif key not in found:
+                    pending.append(key[1])
+            # SQLite limits bound parameters, so look up in slices.
+            for start in range(0, len(pending), 500):
+                hashes = pending[start : start + 500]
+                rows = self._conn.execute(
+                    f"""
+                    SELECT text_hash, vector FROM embeddings
+                    WHERE model = ? AND text_hash IN ({",".join("?" * len(hashes))})
+                    """,
+                    (model, *hashes),
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    vector = vector.tolist()
+                    found[(model, text_hash)] = vector
+                    self._remember((model, text_hash), vector)
+            if pending or len(self._touched) >= self.touch_batch:
+                self._touch((model, h) for h in pending if (model, h) in found)
+                self._conn.commit()
+            result = [found.get(key) for key in keys]
+            hit_count = sum(v is not None for v in result)
+            self.hits += hit_count
+            self.misses += len(result) - hit_count
+        return result
+
+    def _touch(self, keys):
+        """Set last_used for `keys` and for the LRU hits recorded so far."""
+        self._touched.update(dict.fromkeys(keys))
+        if not self._touched:
+            return
+        now = time.time()
+        self._conn.executemany(
+            "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+            [(now, model, text_hash) for model, text_hash in self._touched],
+        )
+        self._touched.clear()
+
+    def put_many(self, model, texts, vectors):
+        now = time.time()
+        rows = {}
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = (model, text_key(text))
+                self._remember(key, list(vector))
+                rows[key[1]] = (model, key[1], array("f", vector).tobytes(), now)
+            if self._size is None:
+                (self._size,) = self._conn.execute(
+                    "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+                ).fetchone()
+            # Replaced rows no longer count.
+            hashes = list(rows)
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start : start + 500]
+                (replaced,) = self._conn.execute(
+                    f"""
+                    SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings
+                    WHERE model = ? AND text_hash IN ({",".join("?" * len(batch))})
+                    """,
+                    (model, *batch),
+                ).fetchone()
+                self._size -= replaced
+            self._size += sum(len(row[2]) for row in rows.values())
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows.values()
+            )
+            # Record pending LRU hits first, so eviction sees them as recent.
+            self._touch(())
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        # Rows written by other processes are not in the running total; they are
+        # counted once this process restarts.
+        if self._size <= self.max_bytes:
+            return
+        excess = self._size - self.max_bytes
+        victims = []
+        for model, text_hash, length in self._conn.execute(
+            "SELECT model, text_hash, LENGTH(vector) FROM embeddings ORDER BY last_used"
+        ):
+            victims.append((model, text_hash))
+            self._lru.pop((model, text_hash), None)
+            self._size -= length
+            excess -= length
+            if excess <= 0:
+                break
+        self._conn.executemany(
+            "DELETE FROM embeddings WHERE model = ? AND text_hash = ?", victims
+        )
+        self._conn.commit()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "lru_entries": len(self._lru),
+        }
+
+    def close(self):
+        self._conn.close()
+
+
+_shared_caches = {}
+
+
+def get_shared_cache(path=DEFAULT_CACHE_PATH):
+    """One EmbeddingCache per path per process, shared by ingestion and querying."""
+    path = str(path)
+    if path not in _shared_caches:
+        _shared_caches[path] = EmbeddingCache(path)
+    return _shared_caches[path]
+
+
+class CachedEmbeddings:
+    """
+    Read-through wrapper exposing the LangChain `embed_query` / `embed_documents`
+    interface; only texts missing from the cache reach the wrapped embedder.
+    """
+
+    def __init__(self, embedder, cache=None, model=None):
+        self.embedder = embedder
+        self.cache = cache or get_shared_cache()
+        self.model = model or getattr(embedder, "model", DEFAULT_MODEL)
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        vectors = self.cache.get_many(self.model, texts)
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(texts[i], []).append(i)
+        if missing:
+            fresh_texts = list(missing)
+            fresh = self.embedder.embed_documents(fresh_texts)
+            self.cache.put_many(self.model, fresh_texts, fresh)
+            for text, vector in zip(fresh_texts, fresh):
+                for i in missing[text]:
+                    vectors[i] = list(vector)
+        return vectors
+
+    def embed_query(self, text):
+        (vector,) = self.cache.get_many(self.model, [text])
+        if vector is None:
+            vector = self.embedder.embed_query(text)
+            self.cache.put_many(self.model, [text], [vector])
+        return vector
+
+    async def aembed_query(self, text):
+        # SQLite lookups block, so keep them off the event loop.
+        (vector,) = await asyncio.to_thread(self.cache.get_many, self.model, [text])
+        if vector is None:
+            if hasattr(self.embedder, "aembed_query"):
+                vector = await self.embedder.aembed_query(text)
+            else:
+                vector = await asyncio.to_thread(self.embedder.embed_query, text)
+            await asyncio.to_thread(self.cache.put_many, self.model, [text], [vector])
+        return vector
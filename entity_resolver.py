@@ -0,0 +1,405 @@
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+import numpy as np
+from langchain_openai import OpenAIEmbeddings
+
+from embedding_cache import CachedEmbeddings
+from ontology_store import type_key
+
+DEFAULT_ALIAS_PATH = os.environ.get("ENTITY_ALIAS_PATH", "entity_aliases.sqlite")
+
+STOPWORDS = {"a", "an", "and", "for", "in", "of", "on", "the", "to"}
+# Types (as type_key) whose values are literals or titles rather than names:
+# "1 Feb 2024" / "1 Feb 2025" or "Finance Minister" / "Finance Ministry" are
+# different things however similar they look.
+LITERAL_TYPES = {
+    "amount",
+    "currency",
+    "date",
+    "designation",
+    "figure",
+    "jobtitle",
+    "money",
+    "number",
+    "percentage",
+    "position",
+    "quantity",
+    "role",
+    "time",
+    "title",
+    "year",
+}
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACE = re.compile(r"\s+")
+_DIGIT = re.compile(r"\d")
+
+
+def _words(name):
+    name = unicodedata.normalize("NFKC", name).lower().replace("&", " and ")
+    return _SPACE.sub(" ", _NON_WORD.sub(" ", name)).split()
+
+
+def normalize_name(name):
+    """
+    Case-, punctuation- and stopword-insensitive key: "The Ministry of Finance"
+    and "ministry finance" both become "ministry finance". Word order is kept,
+    so "Bank of India" and "India Bank" differ.
+    """
+    words = [w for w in _words(name) if w not in STOPWORDS]
+    return " ".join(words or _words(name))
+
+
+def alias_key(name, typ):
+    """
+    Exact-match key of a surface form: its normalised name, so the same name under
+    `organization` and `ministry` is one entity. Literals are also keyed by type.
+    """
+    if is_literal(name, typ):
+        return f"{type_key(typ or '')}:{normalize_name(name)}"
+    return normalize_name(name)
+
+
+def is_literal(name, typ):
+    """Dates, amounts, numbers and titles, which are only merged when spelled alike."""
+    return bool(_DIGIT.search(name)) or type_key(typ or "") in LITERAL_TYPES
+
+
+def acronyms(name):
+    """Initialisms of a multi-word name, with and without stopwords ("mof", "mf")."""
+    words = _words(name)
+    if len(words) < 2:
+        return set()
+    content = [w for w in words if w not in STOPWORDS]
+    return {"".join(w[0] for w in words), "".join(w[0] for w in content)}
+
+
+def is_acronym(name):
+    name = name.strip()
+    return (
+        2 <= len(name) <= 8
+        and " " not in name
+        and sum(c.isupper() for c in name) >= 2
+    )
+
+
+def trigrams(key):
+    padded = f"  {key} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class EntityResolver:
+    """
+    Maps entity surface forms to canonical entities before graph writes.
+
+    Candidates are blocked cheaply: an exact key (the name with case, punctuation
+    and stopwords ignored, whatever its type) resolves immediately; otherwise
+    entities sharing enough character trigrams (Jaccard >=
+    `ngram_threshold`) or matching as an acronym ("MoF" / "Ministry of
+    Finance") are confirmed by embedding cosine similarity (`match_threshold`,
+    or the looser `acronym_threshold`, since acronyms embed far from their
+    expansions). Names containing digits and literal types (`LITERAL_TYPES`:
+    dates, amounts, titles, ...) are only resolved by exact key within their type.
+
+    Every resolved surface form is persisted in an alias table, so later runs
+    resolve it without another embedding lookup.
+    """
+
+    def __init__(
+        self,
+        path=DEFAULT_ALIAS_PATH,
+        embedder=None,
+        match_threshold=0.88,
+        acronym_threshold=0.75,
+        ngram_threshold=0.5,
+        max_candidates=5,
+    ):
+        self.path = str(path)
+        self.embedder = embedder or CachedEmbeddings(
+            OpenAIEmbeddings(model="text-embedding-3-small")
+        )
+        self.match_threshold = match_threshold
+        self.acronym_threshold = acronym_threshold
+        self.ngram_threshold = ngram_threshold
+        self.max_candidates = max_candidates
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entities (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                type TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS aliases (
+                key TEXT PRIMARY KEY,
+                surface TEXT NOT NULL,
+                entity_id INTEGER NOT NULL REFERENCES entities(id)
+            );
+            """
+        )
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        self.names, self.types = {}, {}
+        self.alias_ids = {}
+        self._trigram_index, self._trigrams = {}, {}
+        self._acronym_index, self._short_index = {}, {}
+        for entity_id, name, typ in self._conn.execute("SELECT * FROM entities"):
+            self.names[entity_id] = name
+            self.types[entity_id] = typ
+        for _, surface, entity_id in self._conn.execute("SELECT * FROM aliases"):
+            # Keys are re-derived, so aliases stored under older key formats load.
+            key = alias_key(surface, self.types[entity_id])
+            self._index(key, surface, entity_id)
+
+    def _index(self, key, surface, entity_id):
+        self.alias_ids[key] = entity_id
+        if is_literal(surface, self.types[entity_id]):
+            return
+        grams = trigrams(key)
+        self._trigrams[key] = grams
+        for gram in grams:
+            self._trigram_index.setdefault(gram, set()).add(key)
+        for acronym in acronyms(surface):
+            self._acronym_index.setdefault(acronym, set()).add(entity_id)
+        if is_acronym(surface):
+            self._short_index.setdefault(surface.lower(), set()).add(entity_id)
+
+    def _candidates(self, name, typ):
+        """
+        [(entity_id, threshold)] to confirm by embedding, best n-gram match first;
+        none for literals, which are never indexed either.
+        """
+        if is_literal(name, typ):
+            return []
+        found = {}
+        if is_acronym(name):
+            for entity_id in self._acronym_index.get(name.lower(), ()):
+                found[entity_id] = self.acronym_threshold
+        for acronym in acronyms(name):
+            for entity_id in self._short_index.get(acronym, ()):
+                found[entity_id] = self.acronym_threshold
+        grams = trigrams(normalize_name(name))
+        shared = {}
+        for gram in grams:
+            for other in self._trigram_index.get(gram, ()):
+                shared[other] = shared.get(other, 0) + 1
+        scored = []
+        for other, count in shared.items():
+            jaccard = count / (len(grams) + len(self._trigrams[other]) - count)
+            if jaccard >= self.ngram_threshold:
+                scored.append((jaccard, other))
+        for _, other in sorted(scored, reverse=True)[: self.max_candidates]:
+            found.setdefault(self.alias_ids[other], self.match_threshold)
+        return list(found.items())
+
+    def resolve_many(self, entities, persist=True):
+        """
+        Resolve (name, type) pairs; returns {(name, type): (canonical name,
+        canonical type)}. Unmatched names become new canonical entities, which
+        are only kept if `persist` is true.
+        """
+        result = {}
+        with self._lock:
+            pending = []
+            for name, typ in dict.fromkeys(entities):
+                key = alias_key(name, typ)
+                if not normalize_name(name):
+                    result[(name, typ)] = (name, typ)
+                elif key in self.alias_ids:
+                    entity_id = self.alias_ids[key]
+                    canonical = (self.names[entity_id], self.types[entity_id])
+                    result[(name, typ)] = canonical
+                else:
+                    pending.append((name, typ, key))
+            if not pending:
+                return result
+
+            # One embedding batch for the new names and every pre-existing candidate;
+            # entities created below are among the new names.
+            texts = {name for name, _, _ in pending}
+            for name, typ, _ in pending:
+                texts.update(self.names[i] for i, _ in self._candidates(name, typ))
+            texts = list(texts)
+            vectors = np.asarray(self.embedder.embed_documents(texts), dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+            vector_of = dict(zip(texts, vectors))
+
+            new_aliases = []
+            for name, typ, key in pending:
+                if key in self.alias_ids:
+                    # Same key as a name created earlier in this batch
+                    entity_id = self.alias_ids[key]
+                else:
+                    entity_id, best = None, 0.0
+                    for candidate, threshold in self._candidates(name, typ):
+                        other = vector_of.get(self.names[candidate])
+                        if other is None:
+                            continue
+                        similarity = float(vector_of[name] @ other)
+                        if similarity >= threshold and similarity > best:
+                            entity_id, best = candidate, similarity
+                    if entity_id is None:
+                        # SQLite assigns the id, so concurrent processes never
+                        # hand out the same one.
+                        entity_id = self._conn.execute(
+                            "INSERT INTO entities (name, type) VALUES (?, ?)",
+                            (name, typ),
+                        ).lastrowid
+                        self.names[entity_id], self.types[entity_id] = name, typ
+                    self._index(key, name, entity_id)
+                    new_aliases.append((key, name, entity_id))
+                result[(name, typ)] = (self.names[entity_id], self.types[entity_id])
+
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO aliases VALUES (?, ?, ?)", new_aliases
+            )
+            if persist:
+                self._conn.commit()
+            else:
+                self._conn.rollback()
+                self._load()
+        return result
+
+    def resolve_triplets(self, chunk_triplets):
+        """Rewrite [(chunk_id, triplets)] with canonical entity names and types."""
+        entities = []
+        for _, triplets in chunk_triplets:
+            for s, s_type, _, o, o_type in triplets:
+                entities.append((s.strip(), s_type))
+                entities.append((o.strip(), o_type))
+        if not entities:
+            return chunk_triplets
+        canonical = self.resolve_many(entities)
+        resolved = []
+        for chunk_id, triplets in chunk_triplets:
+            rows = []
+            for s, s_type, p, o, o_type in triplets:
+                s, s_type = canonical[(s.strip(), s_type)]
+                o, o_type = canonical[(o.strip(), o_type)]
+                rows.append((s, s_type, p, o, o_type))
+            resolved.append((chunk_id, rows))
+        return resolved
+
+    def close(self):
+        self._conn.close()
+
+
+def merge_duplicates(driver, resolver, dry_run=False, batch_size=500):
+    """
+    Merge entity nodes that resolve to the same canonical entity. Relationships of
+    each duplicate are re-created on the canonical node (one UNWIND statement per
+    relationship type and direction), then the duplicate is deleted. Returns the
+    number of duplicate nodes found.
+    """
+    from answer_cache import invalidate_chunks
+    from triplet_extractor import quote_name, safe_label
+
+    with driver.session() as session:
+        nodes = session.run(
+            """
+            MATCH (n)
+            WHERE n.name IS NOT NULL AND NOT n:Chunk AND NOT n:Document
+            RETURN elementId(n) AS id, n.name AS name, labels(n)[0] AS label
+            """
+        ).data()
+        rel_types = session.run(
+            "CALL db.relationshipTypes() YIELD relationshipType RETURN relationshipType"
+        ).value()
+    # Longer names first, so full names rather than acronyms become canonical.
+    nodes.sort(key=lambda n: (-len(n["name"]), n["name"]))
+    canonical = resolver.resolve_many(
+        ((n["name"], n["label"].lower()) for n in nodes), persist=not dry_run
+    )
+
+    # Grouped by canonical entity, so duplicates under other labels merge too.
+    groups = {}
+    for n in nodes:
+        groups.setdefault(canonical[(n["name"], n["label"].lower())], []).append(n)
+    pairs = []
+    for (name, typ), members in groups.items():
+        if len(members) < 2:
+            continue
+        label = safe_label(typ)
+        keep = next(
+            (m for m in members if m["name"] == name and m["label"] == label),
+            members[0],
+        )
+        for m in members:
+            if m is not keep:
+                print(f"🔗 {m['name']} ({m['label']}) -> {name} ({keep['label']})")
+                pairs.append({"dup": m["id"], "keep": keep["id"]})
+    if dry_run or not pairs:
+        return len(pairs)
+
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start : start + batch_size]
+        with driver.session() as session:
+            chunk_ids = session.run(
+                """
+                UNWIND $pairs AS p
+                MATCH (c:Chunk)-[:MENTIONS]->(d) WHERE elementId(d) = p.dup
+                RETURN DISTINCT c.chunk_id AS cid
+                """,
+                pairs=batch,
+            ).value()
+
+            def merge(tx):
+                for rel in rel_types:
+                    for pattern, create in (
+                        ("(d)-[r:{t}]->(x)", "(k)-[:{t}]->(x)"),
+                        ("(x)-[r:{t}]->(d)", "(x)-[:{t}]->(k)"),
+                    ):
+                        tx.run(
+                            f"""
+                            UNWIND $pairs AS p
+                            MATCH (d) WHERE elementId(d) = p.dup
+                            MATCH (k) WHERE elementId(k) = p.keep
+                            MATCH {pattern.format(t=quote_name(rel))}
+                            WHERE x <> k
+                            MERGE {create.format(t=quote_name(rel))}
+                            """,
+                            pairs=batch,
+                        )
+                tx.run(
+                    """
+                    UNWIND $pairs AS p
+                    MATCH (d) WHERE elementId(d) = p.dup
+                    DETACH DELETE d
+                    """,
+                    pairs=batch,
+                )
+
+            session.execute_write(merge)
+        invalidate_chunks(chunk_ids)
+    return len(pairs)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+    from neo4j import GraphDatabase
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Merge duplicate entity nodes already in the graph."
+    )
+    parser.add_argument("--path", default=DEFAULT_ALIAS_PATH)
+    parser.add_argument("--dry-run", action="store_true", help="Only list the merges")
+    args = parser.parse_args()
+
+    driver = GraphDatabase.driver(
+        os.getenv("NEO4J_URI"),
+        auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+    )
+    count = merge_duplicates(driver, EntityResolver(args.path), dry_run=args.dry_run)
+    verb = "Found" if args.dry_run else "Merged"
+    print(f"✅ {verb} {count} duplicate entity nodes")
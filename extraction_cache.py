@@ -0,0 +1,230 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+DEFAULT_EXTRACTION_CACHE_PATH = os.environ.get(
+    "EXTRACTION_CACHE_PATH", "extraction_cache.sqlite"
+)
+
+_SPACE = re.compile(r"\s+")
+_MAX_HASH = (1 << 32) - 1
+_PRIME = (1 << 61) - 1
+
+
+def normalize_text(text):
+    """Case- and whitespace-insensitive form of a chunk, used for exact matches."""
+    return _SPACE.sub(" ", text).strip().lower()
+
+
+def extraction_key(model, prompt_version, text):
+    raw = f"{model}\0{prompt_version}\0{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _hash32(shingle):
+    digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest()
+    return int.from_bytes(digest, "little")
+
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles. Two signatures agree in a share of
+    positions that estimates the Jaccard similarity of the shingle sets; LSH
+    banding (`bands` groups of `num_perm / bands` rows) finds candidate pairs.
+    """
+
+    def __init__(self, num_perm=64, bands=8, shingle_size=3, seed=1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+    def shingles(self, text):
+        words = normalize_text(text).split(" ")
+        n = self.shingle_size
+        if len(words) <= n:
+            return {" ".join(words)}
+        return {" ".join(words[i : i + n]) for i in range(len(words) - n + 1)}
+
+    def signature(self, text):
+        hashes = np.array([_hash32(s) for s in self.shingles(text)], dtype=np.uint64)
+        # Universal hashing; uint64 overflow only adds mixing.
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def band_keys(self, signature):
+        keys = []
+        for b in range(self.bands):
+            band = signature[b * self.rows : (b + 1) * self.rows].tobytes()
+            keys.append(f"{b}:{hashlib.blake2b(band, digest_size=8).hexdigest()}")
+        return keys
+
+    @staticmethod
+    def similarity(a, b):
+        return float(np.mean(a == b))
+
+
+class MinHashLSH:
+    """In-memory LSH table, used to find near-duplicates within one run."""
+
+    def __init__(self, hasher):
+        self.hasher = hasher
+        self._buckets = {}
+        self._signatures = {}
+
+    def add(self, key, signature):
+        self._signatures[key] = signature
+        for band in self.hasher.band_keys(signature):
+            self._buckets.setdefault(band, []).append(key)
+
+    def query(self, signature, threshold):
+        """Most similar stored key with similarity >= threshold, or None."""
+        best, best_sim = None, threshold
+        seen = set()
+        for band in self.hasher.band_keys(signature):
+            for key in self._buckets.get(band, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                sim = self.hasher.similarity(signature, self._signatures[key])
+                if sim >= best_sim:
+                    best, best_sim = key, sim
+        return best
+
+
+class ExtractionCache:
+    """
+    Persistent store of LLM-extracted triplets keyed by (model, prompt version,
+    normalised chunk text).
+
+    Besides exact matches, chunks whose MinHash signature agrees with a stored
+    chunk in at least `near_threshold` of positions (estimated Jaccard similarity
+    of their word shingles) reuse that chunk's triplets. This catches repeated
+    headers, footers and disclaimers that differ only in page numbers or dates.
+    Set `near_threshold=None` to match exact text only.
+    """
+
+    def __init__(self, path=DEFAULT_EXTRACTION_CACHE_PATH, near_threshold=0.85):
+        self.path = str(path)
+        self.near_threshold = near_threshold
+        self.hasher = MinHasher()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                signature BLOB NOT NULL,
+                triplets TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS extraction_bands (
+                band TEXT NOT NULL,
+                key TEXT NOT NULL REFERENCES extractions(key) ON DELETE CASCADE
+            );
+            CREATE INDEX IF NOT EXISTS extraction_bands_band
+                ON extraction_bands(band);
+            """
+        )
+        self._conn.commit()
+
+    def lookup(self, model, prompt_version, text):
+        """
+        Return (key, signature, triplets, match) where match is "exact", "near" or
+        None; triplets are None on a miss.
+        """
+        key = extraction_key(model, prompt_version, text)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT triplets FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self.exact_hits += 1
+                return key, None, self._decode(row[0]), "exact"
+        signature = self.hasher.signature(text)
+        if self.near_threshold is not None:
+            bands = self.hasher.band_keys(signature)
+            with self._lock:
+                rows = self._conn.execute(
+                    f"""
+                    SELECT DISTINCT e.signature, e.triplets
+                    FROM extraction_bands b JOIN extractions e ON e.key = b.key
+                    WHERE b.band IN ({",".join("?" * len(bands))})
+                        AND e.model = ? AND e.prompt_version = ?
+                    """,
+                    (*bands, model, prompt_version),
+                ).fetchall()
+            best, best_sim = None, self.near_threshold
+            for blob, triplets in rows:
+                sim = self.hasher.similarity(
+                    signature, np.frombuffer(blob, dtype=np.uint32)
+                )
+                if sim >= best_sim:
+                    best, best_sim = triplets, sim
+            if best is not None:
+                with self._lock:
+                    self.near_hits += 1
+                return key, signature, self._decode(best), "near"
+        with self._lock:
+            self.misses += 1
+        return key, signature, None, None
+
+    @staticmethod
+    def _decode(triplets):
+        return [tuple(t) for t in json.loads(triplets)]
+
+    def put_many(self, model, prompt_version, entries):
+        """Store (key, signature, triplets) entries."""
+        now = time.time()
+        rows, bands = [], []
+        for key, signature, triplets in entries:
+            rows.append(
+                (
+                    key,
+                    model,
+                    prompt_version,
+                    signature.tobytes(),
+                    json.dumps(triplets),
+                    now,
+                )
+            )
+            bands.extend((band, key) for band in self.hasher.band_keys(signature))
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM extraction_bands WHERE key = ?", [(r[0],) for r in rows]
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.executemany("INSERT INTO extraction_bands VALUES (?, ?)", bands)
+            self._conn.commit()
+
+    def stats(self):
+        total = self.exact_hits + self.near_hits + self.misses
+        hits = self.exact_hits + self.near_hits
+        return {
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_LEDGER_PATH = os.environ.get(
+    "INGESTION_LEDGER_PATH", "ingestion_ledger.sqlite"
+)
+
+# Per-chunk progress, in pipeline order.
+PARSED, EMBEDDED, EXTRACTED, WRITTEN = "parsed", "embedded", "extracted", "written"
+
+
+def file_hash(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IngestionLedger:
+    """
+    SQLite record of ingestion progress, used to resume after a crash and to
+    re-process only what changed.
+
+    `files` holds each PDF's content hash, size and mtime and whether it finished;
+    `legacy` marks files imported from processed.json, whose chunks were never
+    recorded here. `chunks` holds
+    each chunk's text hash and state (parsed -> embedded -> extracted -> written);
+    extracted triplets are stored so a crash between the LLM call and the graph
+    write does not cost another LLM call. `near` marks triplets borrowed from a
+    near-duplicate chunk, which only get MENTIONS edges when written.
+    """
+
+    def __init__(self, path=DEFAULT_LEDGER_PATH):
+        self.path = str(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                name TEXT PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL,
+                size INTEGER,
+                mtime_ns INTEGER,
+                legacy INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                doc_id TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                state TEXT NOT NULL,
+                triplets TEXT,
+                updated_at REAL NOT NULL,
+                near INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS chunks_doc ON chunks(doc_id);
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        if "legacy" not in columns:
+            # Ledgers created before these columns: imported files are the ones
+            # marked done without any chunk rows.
+            self._conn.executescript(
+                """
+                ALTER TABLE files ADD COLUMN size INTEGER;
+                ALTER TABLE files ADD COLUMN mtime_ns INTEGER;
+                ALTER TABLE files ADD COLUMN legacy INTEGER NOT NULL DEFAULT 0;
+                UPDATE files SET legacy = 1
+                WHERE done = 1 AND doc_id NOT IN (SELECT doc_id FROM chunks);
+                """
+            )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")}
+        if "near" not in columns:
+            self._conn.execute(
+                "ALTER TABLE chunks ADD COLUMN near INTEGER NOT NULL DEFAULT 0"
+            )
+        self._conn.commit()
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            self._conn.commit()
+            return cur
+
+    def _executemany(self, sql, rows):
+        with self._lock:
+            self._conn.executemany(sql, rows)
+            self._conn.commit()
+
+    # --- files -------------------------------------------------------------
+
+    def import_processed(self, pdf_paths):
+        """
+        Seed the ledger from the old processed.json: files already processed before
+        the ledger existed are recorded as done with their current hash, so only
+        later edits trigger re-processing. They are marked `legacy`: their chunks
+        are only known to the graph, so a re-ingest diffs against it instead.
+        """
+        now = time.time()
+        for path in pdf_paths:
+            known = self._execute(
+                "SELECT 1 FROM files WHERE name = ?", (Path(path).name,)
+            ).fetchone()
+            if known is None:
+                st = os.stat(path)
+                self._execute(
+                    """
+                    INSERT INTO files
+                        (name, doc_id, content_hash, done, updated_at, size,
+                         mtime_ns, legacy)
+                    VALUES (?, ?, ?, 1, ?, ?, ?, 1)
+                    """,
+                    (
+                        Path(path).name,
+                        Path(path).stem,
+                        file_hash(path),
+                        now,
+                        st.st_size,
+                        st.st_mtime_ns,
+                    ),
+                )
+
+    def is_legacy(self, path):
+        row = self._execute(
+            "SELECT legacy FROM files WHERE name = ?", (Path(path).name,)
+        ).fetchone()
+        return bool(row and row[0])
+
+    def pending_files(self, pdf_paths):
+        """
+        PDFs that are new, changed since last run, or did not finish. Only files
+        whose size or mtime changed are hashed.
+        """
+        pending = []
+        for path in pdf_paths:
+            row = self._execute(
+                "SELECT content_hash, done, size, mtime_ns FROM files WHERE name = ?",
+                (Path(path).name,),
+            ).fetchone()
+            if row is None or not row[1]:
+                pending.append(path)
+                continue
+            st = os.stat(path)
+            if (row[2], row[3]) == (st.st_size, st.st_mtime_ns):
+                continue
+            if row[0] != file_hash(path):
+                pending.append(path)
+            else:
+                # Touched but unchanged; skip the hash next time.
+                self._execute(
+                    "UPDATE files SET size = ?, mtime_ns = ? WHERE name = ?",
+                    (st.st_size, st.st_mtime_ns, Path(path).name),
+                )
+        return pending
+
+    def start_file(self, path):
+        st = os.stat(path)
+        self._execute(
+            """
+            INSERT INTO files
+                (name, doc_id, content_hash, done, updated_at, size, mtime_ns)
+            VALUES (?, ?, ?, 0, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                content_hash = excluded.content_hash, done = 0,
+                updated_at = excluded.updated_at, size = excluded.size,
+                mtime_ns = excluded.mtime_ns
+            """,
+            (
+                Path(path).name,
+                Path(path).stem,
+                file_hash(path),
+                time.time(),
+                st.st_size,
+                st.st_mtime_ns,
+            ),
+        )
+
+    def finish_file(self, path):
+        """
+        Mark a file done if every chunk was written; returns whether it is. Its
+        chunks are all recorded here from then on, so it is no longer `legacy`.
+        """
+        doc_id = Path(path).stem
+        (remaining,) = self._execute(
+            "SELECT COUNT(*) FROM chunks WHERE doc_id = ? AND state != ?",
+            (doc_id, WRITTEN),
+        ).fetchone()
+        if remaining:
+            return False
+        self._execute(
+            "UPDATE files SET done = 1, legacy = 0, updated_at = ? WHERE name = ?",
+            (time.time(), Path(path).name),
+        )
+        return True
+
+    # --- chunks ------------------------------------------------------------
+
+    def add_chunks(self, doc_id, chunks):
+        """
+        Record one batch of a document's chunks (new ids in the `parsed` state) and
+        return their states by id. Streaming callers call this per batch and
+        `stale_chunks` once the whole document has been seen.
+        """
+        chunk_ids = [chunk.metadata["chunk_id"] for chunk in chunks]
+        known = {}
+        for start in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[start : start + 500]
+            known.update(
+                self._execute(
+                    f"SELECT chunk_id, state FROM chunks WHERE chunk_id IN "
+                    f"({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+            )
+        now = time.time()
+        current = {}
+        new_rows = []
+        for chunk_id, chunk in zip(chunk_ids, chunks):
+            state = known.get(chunk_id)
+            if state is None:
+                state = PARSED
+                new_rows.append(
+                    (chunk_id, doc_id, chunk.metadata["text_hash"], PARSED, None, now)
+                )
+            current[chunk_id] = state
+        self._executemany(
+            """
+            INSERT INTO chunks
+                (chunk_id, doc_id, text_hash, state, triplets, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            new_rows,
+        )
+        return current
+
+    def stale_chunks(self, doc_id, current_ids):
+        """Chunk ids recorded for `doc_id` that are not in `current_ids`."""
+        known = self._execute(
+            "SELECT chunk_id FROM chunks WHERE doc_id = ?", (doc_id,)
+        ).fetchall()
+        return [cid for (cid,) in known if cid not in current_ids]
+
+    def forget_chunks(self, chunk_ids):
+        self._executemany(
+            "DELETE FROM chunks WHERE chunk_id = ?", [(cid,) for cid in chunk_ids]
+        )
+
+    def mark(self, chunk_ids, state):
+        now = time.time()
+        self._executemany(
+            "UPDATE chunks SET state = ?, updated_at = ? WHERE chunk_id = ?",
+            [(state, now, cid) for cid in chunk_ids],
+        )
+
+    def save_triplets(self, chunk_id, triplets, near=False):
+        self._execute(
+            """
+            UPDATE chunks SET state = ?, triplets = ?, near = ?, updated_at = ?
+            WHERE chunk_id = ?
+            """,
+            (EXTRACTED, json.dumps(triplets), int(near), time.time(), chunk_id),
+        )
+
+    def load_triplets(self, chunk_ids):
+        """{chunk_id: (triplets, near)} for the chunks with stored triplets."""
+        out = {}
+        for cid in chunk_ids:
+            row = self._execute(
+                "SELECT triplets, near FROM chunks WHERE chunk_id = ?", (cid,)
+            ).fetchone()
+            if row and row[0] is not None:
+                out[cid] = ([tuple(t) for t in json.loads(row[0])], bool(row[1]))
+        return out
+
+    def close(self):
+        self._conn.close()
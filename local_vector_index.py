@@ -0,0 +1,359 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+import numpy as np
+
+DEFAULT_INDEX_PATH = os.environ.get("LOCAL_VECTOR_INDEX_PATH", "vector_index")
+
+
+class LocalVectorIndex:
+    """
+    In-process vector search over Chunk embeddings.
+
+    Vectors are L2-normalised and stored row-wise in a memory-mapped float32 file
+    (`vectors.f32`), so cosine similarity is a single matrix-vector product. Row
+    order is recorded in the append-only `ids.txt`; removed chunks are listed in
+    `deleted.txt` and masked at query time. An optional IVF index (k-means
+    centroids in `ivf.npz`, plus a row -> list assignment in the append-only
+    `assign.i32`) narrows the search to the `n_probe` closest lists.
+    """
+
+    def __init__(self, path=DEFAULT_INDEX_PATH, dim=1536):
+        self.path = Path(path)
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._loaded = None
+        self._ids_bytes = 0
+        self.ids = []
+        self.row_of = {}
+        self.deleted = set()
+        self.dead = np.zeros(0, dtype=bool)
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.centroids = None
+        self.assign = None
+        if self.exists(self.path):
+            self._load()
+
+    @staticmethod
+    def exists(path=DEFAULT_INDEX_PATH):
+        return (Path(path) / "meta.json").exists()
+
+    # --- storage -------------------------------------------------------------
+
+    def _files(self):
+        p = self.path
+        return p / "vectors.f32", p / "ids.txt", p / "deleted.txt", p / "meta.json"
+
+    def _ivf_files(self):
+        return self.path / "ivf.npz", self.path / "assign.i32"
+
+    def _assigned(self):
+        """Number of rows with a list assignment in `assign.i32`."""
+        assign_file = self._ivf_files()[1]
+        return assign_file.stat().st_size // 4 if assign_file.exists() else 0
+
+    def _open_assign(self, rows):
+        """Map the first `rows` list assignments (fewer if some are missing)."""
+        count = min(rows, self._assigned())
+        if not count:
+            return np.zeros(0, dtype=np.int32)
+        return np.memmap(
+            self._ivf_files()[1], dtype=np.int32, mode="r", shape=(count,)
+        )
+
+    def _load(self):
+        vec_file, ids_file, deleted_file, meta_file = self._files()
+        self.dim = json.loads(meta_file.read_text())["dim"]
+        # The last line is partial (or empty) unless the file ends in a newline.
+        lines = ids_file.read_bytes().split(b"\n")[:-1]
+        rows = min(len(lines), vec_file.stat().st_size // (4 * self.dim))
+        # An interrupted append can leave one side longer than the other. Readers
+        # only ignore the extra rows (a writer may be between its two writes);
+        # `_repair` cuts them off before the next append.
+        self.ids = [line.decode("utf-8") for line in lines[:rows]]
+        self._ids_bytes = sum(len(line) + 1 for line in lines[:rows])
+        self.row_of = {cid: i for i, cid in enumerate(self.ids)}
+        self.deleted = set()
+        if deleted_file.exists():
+            self.deleted = set(deleted_file.read_text(encoding="utf-8").splitlines())
+        self._mark_dead()
+        if rows:
+            self.vectors = np.memmap(
+                vec_file, dtype=np.float32, mode="r", shape=(rows, self.dim)
+            )
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        ivf_file = self._ivf_files()[0]
+        self.centroids = self.assign = None
+        if ivf_file.exists():
+            self.centroids = np.load(ivf_file)["centroids"]
+            self.assign = self._open_assign(rows)
+        self._loaded = self._stamp()
+
+    def _stamp(self):
+        """Size and mtime of the vector, id, deletion and IVF files."""
+        stamp = []
+        for f in (*self._files()[:3], *self._ivf_files()):
+            try:
+                st = f.stat()
+            except FileNotFoundError:
+                stamp.append(None)
+            else:
+                stamp.append((st.st_size, st.st_mtime_ns))
+        return tuple(stamp)
+
+    def _repair(self):
+        """Truncate rows an interrupted append left in only one of the two files."""
+        vec_file, ids_file, _, _ = self._files()
+        size = len(self.ids) * 4 * self.dim
+        if vec_file.stat().st_size != size:
+            os.truncate(vec_file, size)
+        if ids_file.stat().st_size != self._ids_bytes:
+            os.truncate(ids_file, self._ids_bytes)
+        if self.centroids is None:
+            return
+        assign_file = self._ivf_files()[1]
+        if self._assigned() > len(self.ids):
+            os.truncate(assign_file, len(self.ids) * 4)
+        elif len(self.assign) < len(self.ids):
+            missing = self.vectors[len(self.assign) :]
+            with open(assign_file, "ab") as f:
+                f.write(self._assign_rows(missing).tobytes())
+        self.assign = self._open_assign(len(self.ids))
+
+    def _assign_rows(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _mark_dead(self):
+        self.dead = np.zeros(len(self.ids), dtype=bool)
+        rows = [self.row_of[cid] for cid in self.deleted if cid in self.row_of]
+        self.dead[rows] = True
+
+    def refresh(self):
+        """Pick up rows appended or removed by another process (e.g. an ingest)."""
+        if self.exists(self.path) and self._stamp() != self._loaded:
+            with self._lock:
+                self._load()
+
+    def _init_storage(self):
+        self.path.mkdir(parents=True, exist_ok=True)
+        vec_file, ids_file, _, meta_file = self._files()
+        vec_file.touch()
+        ids_file.touch()
+        meta_file.write_text(json.dumps({"dim": self.dim}))
+
+    @staticmethod
+    def _normalise(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def append(self, chunk_ids, vectors):
+        """Append new chunks; ids already in the index are skipped."""
+        with self._lock:
+            if not self.exists(self.path):
+                self._init_storage()
+            if self._stamp() != self._loaded:
+                self._load()
+            self._repair()
+            # Content-addressed ids never change vector, so a re-ingested chunk
+            # that was removed only needs un-deleting.
+            revived = self.deleted.intersection(chunk_ids)
+            if revived:
+                self.deleted -= revived
+                self._files()[2].write_text(
+                    "".join(cid + "\n" for cid in sorted(self.deleted)),
+                    encoding="utf-8",
+                )
+                self._mark_dead()
+                self._loaded = self._stamp()
+            pairs = [
+                (cid, vec)
+                for cid, vec in zip(chunk_ids, vectors)
+                if cid not in self.row_of
+            ]
+            if not pairs:
+                return 0
+            unique = dict(pairs)
+            new_ids = list(unique)
+            block = self._normalise(list(unique.values()))
+            vec_file, ids_file, _, _ = self._files()
+            id_bytes = "".join(cid + "\n" for cid in new_ids).encode("utf-8")
+            with open(vec_file, "ab") as f:
+                f.write(block.tobytes())
+            with open(ids_file, "ab") as f:
+                f.write(id_bytes)
+            if self.centroids is not None:
+                with open(self._ivf_files()[1], "ab") as f:
+                    f.write(self._assign_rows(block).tobytes())
+            # Extend the in-memory state rather than re-reading ids.txt.
+            start = len(self.ids)
+            self.ids.extend(new_ids)
+            self.row_of.update(zip(new_ids, range(start, len(self.ids))))
+            self._ids_bytes += len(id_bytes)
+            self.dead = np.concatenate([self.dead, np.zeros(len(new_ids), dtype=bool)])
+            self.vectors = np.memmap(
+                vec_file, dtype=np.float32, mode="r", shape=(len(self.ids), self.dim)
+            )
+            if self.centroids is not None:
+                self.assign = self._open_assign(len(self.ids))
+            self._loaded = self._stamp()
+            return len(new_ids)
+
+    def remove(self, chunk_ids):
+        with self._lock:
+            if not self.exists(self.path):
+                return
+            gone = [cid for cid in chunk_ids if cid in self.row_of]
+            if not gone:
+                return
+            self.deleted.update(gone)
+            with open(self._files()[2], "a", encoding="utf-8") as f:
+                f.write("".join(cid + "\n" for cid in gone))
+            self._mark_dead()
+            self._loaded = self._stamp()
+
+    def export_from_neo4j(self, driver, batch_size=5000):
+        """Rebuild the index from every Chunk.embedding in the graph."""
+        if self.path.exists():
+            for f in self.path.iterdir():
+                f.unlink()
+        self.ids, self.row_of, self.deleted = [], {}, set()
+        self.dead = np.zeros(0, dtype=bool)
+        self.centroids = self.assign = None
+        with driver.session() as session:
+            result = session.run(
+                """
+                MATCH (c:Chunk) WHERE c.embedding IS NOT NULL
+                RETURN c.chunk_id AS cid, c.embedding AS embedding
+                ORDER BY cid
+                """
+            )
+            ids, vecs = [], []
+            for row in result:
+                ids.append(row["cid"])
+                vecs.append(row["embedding"])
+                if len(ids) >= batch_size:
+                    self.dim = len(vecs[0])
+                    self.append(ids, vecs)
+                    ids, vecs = [], []
+            if ids:
+                self.dim = len(vecs[0])
+                self.append(ids, vecs)
+        return len(self.ids)
+
+    # --- search --------------------------------------------------------------
+
+    def build_ivf(self, n_lists=None, iterations=10, sample_size=50_000, seed=0):
+        """Train k-means centroids on a sample and assign every row to a list."""
+        with self._lock:
+            n = len(self.ids)
+            if n == 0:
+                return
+            rng = np.random.default_rng(seed)
+            sample = self.vectors[rng.choice(n, min(n, sample_size), replace=False)]
+            n_lists = min(n_lists or max(1, int(np.sqrt(n))), len(sample))
+            centroids = sample[rng.choice(len(sample), n_lists, replace=False)]
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                for k in range(n_lists):
+                    members = sample[labels == k]
+                    if len(members):
+                        centroids[k] = members.mean(axis=0)
+                centroids = self._normalise(centroids)
+            self.centroids = centroids
+            ivf_file, assign_file = self._ivf_files()
+            # Replaced rather than rewritten: readers may have the old file mapped.
+            tmp = assign_file.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                for i in range(0, n, 65536):
+                    f.write(self._assign_rows(self.vectors[i : i + 65536]).tobytes())
+            os.replace(tmp, assign_file)
+            np.savez(ivf_file, centroids=centroids)
+            self.assign = self._open_assign(n)
+            self._loaded = self._stamp()
+
+    def search(self, query, top_k=10, n_probe=None):
+        """
+        Return [(chunk_id, cosine score)] best first. Exact brute-force search by
+        default; with an IVF index and `n_probe`, only the closest lists are scanned.
+        """
+        self.refresh()
+        # An append swaps these while extending `ids`, so take them together.
+        with self._lock:
+            ids, vectors, dead = self.ids, self.vectors, self.dead
+            centroids, assign = self.centroids, self.assign
+        if not len(vectors):
+            return []
+        q = self._normalise([query])[0]
+        if n_probe and centroids is not None:
+            lists = np.argsort(centroids @ q)[::-1][:n_probe]
+            probed = np.isin(assign, lists)
+            # Rows an interrupted append left unassigned are always scanned.
+            probed = np.concatenate(
+                [probed, np.ones(len(vectors) - len(assign), dtype=bool)]
+            )
+            rows = np.flatnonzero(probed & ~dead)
+            scores = vectors[rows] @ q
+        else:
+            rows = None
+            scores = np.where(dead, -np.inf, vectors @ q)
+        k = min(top_k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [
+            (ids[rows[i] if rows is not None else i], float(scores[i]))
+            for i in top
+            if np.isfinite(scores[i])
+        ]
+
+    def recall(self, queries, top_k=10, n_probe=8):
+        """Mean recall@k of the IVF search against exact search for `queries`."""
+        total = 0.0
+        for q in queries:
+            exact = {cid for cid, _ in self.search(q, top_k)}
+            approx = {cid for cid, _ in self.search(q, top_k, n_probe=n_probe)}
+            total += len(exact & approx) / max(1, len(exact))
+        return total / max(1, len(queries))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+    from neo4j import GraphDatabase
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Export Chunk embeddings from Neo4j into a local vector index."
+    )
+    parser.add_argument("--path", default=DEFAULT_INDEX_PATH)
+    parser.add_argument(
+        "--ivf-lists", type=int, default=0, help="Build an IVF index with N lists"
+    )
+    parser.add_argument(
+        "--recall-sample", type=int, default=0, help="Measure IVF recall on N rows"
+    )
+    parser.add_argument("--n-probe", type=int, default=8)
+    args = parser.parse_args()
+
+    index = LocalVectorIndex(args.path)
+    driver = GraphDatabase.driver(
+        os.getenv("NEO4J_URI"),
+        auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+    )
+    count = index.export_from_neo4j(driver)
+    print(f"✅ Exported {count} chunk embeddings to {args.path}")
+    if args.ivf_lists:
+        index.build_ivf(args.ivf_lists)
+        print(f"✅ Built IVF index with {args.ivf_lists} lists")
+    if args.recall_sample and index.centroids is not None:
+        rng = np.random.default_rng(0)
+        rows = rng.choice(len(index.ids), min(args.recall_sample, len(index.ids)))
+        recall = index.recall([index.vectors[r] for r in rows], n_probe=args.n_probe)
+        print(f"📈 IVF recall@10 with n_probe={args.n_probe}: {recall:.3f}")
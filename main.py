@@ -1,12 +1,16 @@
 from pathlib import Path
+import argparse
+import asyncio
 import json
+import os
 
-from document_ingestor import DocumentIngestor
+import telemetry
+from ingestion_ledger import IngestionLedger
+from pipeline import IngestionPipeline
+from schema_manager import SchemaManager
 from semantic_agent import SemanticAgent
 from dotenv import load_dotenv
 
-from triplet_extractor import TripletExtractor
-
 
 PROCESSED_LOG = Path("processed.json")
 
@@ -19,67 +23,91 @@ def load_processed():
     return set()
 
 
-def save_processed(files):
-    with open(PROCESSED_LOG, "w") as f:
-        json.dump(sorted(list(files)), f)
-
-
 def process_new_files():
     print("\n🔍 Checking for new PDFs in /data")
     data_dir = Path("data")
-    all_pdfs = set(p.name for p in data_dir.glob("*.pdf"))
-    processed = load_processed()
-    new_files = all_pdfs - processed
+    all_pdfs = sorted(data_dir.glob("*.pdf"))
+    ledger = IngestionLedger()
+    # Files recorded by the old processed.json count as done until they change.
+    ledger.import_processed(p for p in all_pdfs if p.name in load_processed())
+    new_files = ledger.pending_files(all_pdfs)
 
     if not new_files:
         print("✅ No new files to process.")
         return
 
-    extractor = TripletExtractor()  # <--- Move this here for efficiency
+    print(f"📚 {len(new_files)} new, changed or unfinished file(s) to process.")
 
-    for pdf_name in new_files:
-        pdf_path = data_dir / pdf_name
-        doc_id = pdf_path.stem
-        print(f"\n📄 Processing: {pdf_name}")
+    pipeline = IngestionPipeline(ledger=ledger)
+    pipeline.run(new_files)
+    pipeline.print_stats()
 
-        # Ingest the document, creating nodes with embeddings
-        ingestor = DocumentIngestor(str(pdf_path), doc_id)
-        chunks = (
-            ingestor.load_chunks()
-        )  # <-- Get the chunks (do NOT call .ingest(), since it does all writing)
-        ingestor.ingest()  # <-- Still call this to store Chunks and embeddings
+    print("\n✅ All new files processed.")
 
-        # Run triplet/entity extraction on those chunks!
-        extractor.process_chunks(
-            chunks
-        )  # <-- This will create & relate entities in Neo4j
 
-        processed.add(pdf_name)
-        save_processed(processed)  # Save after each file, safer for crash recovery
+async def aquery_graph():
+    # RETRIEVAL_BACKEND=local searches an exported LocalVectorIndex in-process.
+    agent = SemanticAgent(retrieval_backend=os.getenv("RETRIEVAL_BACKEND", "neo4j"))
+    try:
+        while True:
+            question = await asyncio.to_thread(
+                input, "\n💬 Enter your question (or 'exit' to quit): "
+            )
+            question = question.strip()
+            if question.lower() in {"exit", "quit"}:
+                break
 
-    print("\n✅ All new files processed.")
+            print("\n🤖 ", end="", flush=True)
+            async for token in agent.astream_query(question):
+                print(token, end="", flush=True)
+            print()
+    finally:
+        await agent.aclose()
 
 
 def query_graph():
-    agent = SemanticAgent()
-    while True:
-        question = input("\n💬 Enter your question (or 'exit' to quit): ").strip()
-        if question.lower() in {"exit", "quit"}:
-            break
+    # One event loop for the whole session so the async driver's pool is reused.
+    asyncio.run(aquery_graph())
+
 
-        answer = agent.run_query(question)
-        print(f"\n🤖 {answer}")
+def setup_schema():
+    print("\n🛠️ Creating constraints and indexes")
+    manager = SchemaManager()
+    manager.ensure_all()
+    manager.print_report()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="KnowledgeGraph CLI")
+    parser.add_argument(
+        "--profile", action="store_true", help="Print a per-stage time breakdown"
+    )
+    parser.add_argument(
+        "--telemetry-file",
+        help="Write spans and counters here (.json: OpenTelemetry, else Prometheus)",
+    )
+    args = parser.parse_args()
+    if args.profile or args.telemetry_file:
+        telemetry.enable()
+
     print("\n🧠 KnowledgeGraph CLI")
     print("1. Process new PDF files")
     print("2. Query the knowledge graph")
-    choice = input("\nEnter choice (1 or 2): ")
-
-    if choice == "1":
-        process_new_files()
-    elif choice == "2":
-        query_graph()
-    else:
-        print("❌ Invalid choice. Please run the script again.")
+    print("3. Set up graph schema (constraints & indexes)")
+    choice = input("\nEnter choice (1, 2 or 3): ")
+
+    try:
+        if choice == "1":
+            process_new_files()
+        elif choice == "2":
+            query_graph()
+        elif choice == "3":
+            setup_schema()
+        else:
+            print("❌ Invalid choice. Please run the script again.")
+    finally:
+        if args.profile:
+            telemetry.print_report()
+        if args.telemetry_file:
+            telemetry.export(args.telemetry_file)
+            print(f"📈 Telemetry written to {args.telemetry_file}")
@@ -0,0 +1,314 @@
+import difflib
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from filelock import FileLock
+
+ONTOLOGY_PATH = os.environ.get("ONTOLOGY_PATH", "ontology.json")
+KINDS = ("entity_types", "relation_types")
+
+
+# Words ending in "s" that are not plurals of a word without it
+SINGULAR_S = {
+    "analytics",
+    "alias",
+    "atlas",
+    "bias",
+    "canvas",
+    "economics",
+    "ethics",
+    "gas",
+    "headquarters",
+    "logistics",
+    "mathematics",
+    "means",
+    "news",
+    "physics",
+    "politics",
+    "series",
+    "species",
+}
+
+
+def _singular(word):
+    if word in SINGULAR_S or word.endswith(("ss", "us", "is")):
+        return word
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def type_key(name):
+    """Spelling-insensitive key: "Has web-pages" and "has_webpage" -> "haswebpage"."""
+    *head, last = re.findall(r"[^\W_]+", name) or [""]
+    # Plural and singular forms are the same type ("officers" / "officer"). Only
+    # the last word is singularised; in "BreakingNews" that is "News".
+    camel = re.search(r"[A-Z]?[a-z]+$", last)
+    split = camel.start() if camel else 0
+    stem = "".join(head) + last[:split]
+    return stem.lower() + _singular(last[split:].lower())
+
+
+def load_ontology(path=ONTOLOGY_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class OntologyStore:
+    """
+    Versioned, process-safe access to ontology.json.
+
+    Next to `entity_types` and `relation_types` the file holds `aliases` (per kind,
+    alias -> canonical type) and a `version` bumped on every change. A type
+    proposed by the LLM is mapped onto an existing type or alias by spelling
+    (`type_key`), string similarity (`string_threshold`, high enough that only
+    near-identical spellings match, not "office" / "officer") and, if an
+    embedder is given, embedding similarity (`embedding_threshold`); only types
+    matching nothing are added. Updates re-read the file under a lock file and
+    replace it atomically, so concurrent extractor processes do not lose each
+    other's types.
+    """
+
+    def __init__(
+        self,
+        path=ONTOLOGY_PATH,
+        embedder=None,
+        string_threshold=0.95,
+        embedding_threshold=0.9,
+    ):
+        self.path = Path(path)
+        self.lock = FileLock(str(self.path) + ".lock")
+        self.embedder = embedder
+        self.string_threshold = string_threshold
+        self.embedding_threshold = embedding_threshold
+        self._mtime = None
+        with self.lock:
+            self._read()
+
+    # --- storage -----------------------------------------------------------
+
+    def _read(self):
+        data = load_ontology(self.path)
+        data.setdefault("version", 0)
+        aliases = data.setdefault("aliases", {})
+        for kind in KINDS:
+            data.setdefault(kind, [])
+            aliases.setdefault(kind, {})
+        self.data = data
+        self._mtime = self.path.stat().st_mtime_ns
+        self._keys = {}
+        for kind in KINDS:
+            keys = {type_key(alias): c for alias, c in aliases[kind].items()}
+            keys.update((type_key(t), t) for t in data[kind])
+            self._keys[kind] = keys
+
+    def _write(self):
+        """Bump the version and replace the file; the caller holds the lock."""
+        self.data["version"] += 1
+        fd, tmp = tempfile.mkstemp(
+            dir=self.path.parent or ".", prefix=".ontology-", suffix=".json"
+        )
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._read()
+
+    def refresh(self):
+        """Reload if another process changed the file; returns whether it did."""
+        if self.path.stat().st_mtime_ns == self._mtime:
+            return False
+        with self.lock:
+            self._read()
+        return True
+
+    @property
+    def version(self):
+        return self.data["version"]
+
+    @property
+    def entity_types(self):
+        return self.data["entity_types"]
+
+    @property
+    def relation_types(self):
+        return self.data["relation_types"]
+
+    # --- matching ----------------------------------------------------------
+
+    def canonical(self, kind, name):
+        """The type `name` is stored as (itself or via an alias), or None."""
+        return self._keys[kind].get(type_key(name))
+
+    def match(self, kind, name, types=None, vectors=None):
+        """
+        Map `name` onto one of `types` (default: all types of `kind`) by spelling,
+        string similarity, then embedding similarity; None if nothing is close.
+        `vectors` holds embeddings computed earlier (see `_prefetch`).
+        """
+        if types is None:
+            found = self.canonical(kind, name)
+            if found is not None:
+                return found
+            types = self.data[kind]
+        if not types:
+            return None
+        by_key = {type_key(t): t for t in types}
+        close = difflib.get_close_matches(
+            type_key(name), list(by_key), n=1, cutoff=self.string_threshold
+        )
+        if close:
+            return by_key[close[0]]
+        if not self._embedding_match:
+            return None
+        vectors = self._vectors([name, *types], vectors)
+        scores = np.stack([vectors[t] for t in types]) @ vectors[name]
+        best = int(np.argmax(scores))
+        return types[best] if scores[best] >= self.embedding_threshold else None
+
+    @property
+    def _embedding_match(self):
+        return self.embedder is not None and self.embedding_threshold is not None
+
+    def _vectors(self, names, known=None):
+        """Unit embeddings by name; those missing are embedded and added to `known`."""
+        known = {} if known is None else known
+        missing = [n for n in dict.fromkeys(names) if n not in known]
+        if missing:
+            texts = [n.replace("_", " ") for n in missing]
+            vectors = self.embedder.embed_documents(texts)
+            vectors = np.asarray(vectors, dtype=np.float32)
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+            known.update(zip(missing, vectors))
+        return known
+
+    def _prefetch(self, names):
+        """
+        Embed `names` and the known types before taking the lock, so the lock is
+        not held during embedding calls; types added meanwhile are embedded later.
+        """
+        if not self._embedding_match or not names:
+            return None
+        return self._vectors([*names, *self.entity_types, *self.relation_types])
+
+    def propose(self, entity_types=(), relation_types=()):
+        """
+        Register types proposed by the LLM. Returns (mapping, added): mapping sends
+        each proposed type to the type to write it as, per kind; added lists the
+        genuinely new types. Near matches are recorded as aliases.
+        """
+        proposed = {
+            "entity_types": list(entity_types),
+            "relation_types": list(relation_types),
+        }
+        mapping = {kind: {} for kind in KINDS}
+        added = {kind: [] for kind in KINDS}
+        self.refresh()
+        unknown = [
+            name
+            for kind in KINDS
+            for name in proposed[kind]
+            if self.canonical(kind, name) is None
+        ]
+        vectors = self._prefetch(unknown)
+        with self.lock:
+            # Decide against the latest file, not a stale in-memory copy.
+            self._read()
+            changed = False
+            for kind in KINDS:
+                for name in proposed[kind]:
+                    found = self.match(kind, name, vectors=vectors)
+                    if found is None:
+                        self.data[kind].append(name)
+                        self._keys[kind][type_key(name)] = name
+                        added[kind].append(name)
+                        found = name
+                        changed = True
+                    elif self.canonical(kind, name) is None:
+                        self.data["aliases"][kind][name] = found
+                        self._keys[kind][type_key(name)] = found
+                        changed = True
+                    mapping[kind][name] = found
+            if changed:
+                self._write()
+        return mapping, added
+
+    def consolidate(self, dry_run=False):
+        """
+        Fold near-duplicate types already in the ontology into aliases of the
+        earliest similar type. Returns {kind: {alias: canonical}}.
+        """
+        merged = {kind: {} for kind in KINDS}
+        self.refresh()
+        vectors = self._prefetch([*self.entity_types, *self.relation_types])
+        with self.lock:
+            self._read()
+            for kind in KINDS:
+                kept = []
+                for name in self.data[kind]:
+                    found = self.match(kind, name, types=kept, vectors=vectors)
+                    if found is None:
+                        kept.append(name)
+                    else:
+                        merged[kind][name] = found
+                if merged[kind] and not dry_run:
+                    self.data[kind] = kept
+                    aliases = self.data["aliases"][kind]
+                    # Existing aliases of a folded type follow it to its canonical.
+                    for alias, target in aliases.items():
+                        aliases[alias] = merged[kind].get(target, target)
+                    aliases.update(merged[kind])
+            if not dry_run and any(merged.values()):
+                self._write()
+        return merged
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+    from langchain_openai import OpenAIEmbeddings
+
+    from embedding_cache import CachedEmbeddings
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Fold near-duplicate ontology types into aliases."
+    )
+    parser.add_argument("--path", default=ONTOLOGY_PATH)
+    parser.add_argument("--string-threshold", type=float, default=0.95)
+    parser.add_argument(
+        "--embedding-threshold",
+        type=float,
+        default=0.9,
+        help="Cosine similarity for embedding matches; 0 disables them",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Only list merges")
+    args = parser.parse_args()
+
+    embedder = None
+    if args.embedding_threshold:
+        embedder = CachedEmbeddings(OpenAIEmbeddings(model="text-embedding-3-small"))
+    store = OntologyStore(
+        args.path,
+        embedder=embedder,
+        string_threshold=args.string_threshold,
+        embedding_threshold=args.embedding_threshold or None,
+    )
+    merged = store.consolidate(dry_run=args.dry_run)
+    for kind, aliases in merged.items():
+        for alias, canonical in aliases.items():
+            print(f"🔗 {kind}: {alias} -> {canonical}")
+    if not args.dry_run:
+        print(f"✅ Ontology version {store.version}")
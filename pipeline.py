@@ -0,0 +1,363 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from pathlib import Path
+
+from langchain_openai import OpenAIEmbeddings
+from neo4j import GraphDatabase
+
+import telemetry
+from document_ingestor import DocumentIngestor, PageChunker, page_count, split_pages
+from embedding_cache import CachedEmbeddings
+from entity_resolver import EntityResolver
+from ingestion_ledger import EMBEDDED, EXTRACTED, PARSED, WRITTEN, IngestionLedger
+from local_vector_index import LocalVectorIndex
+from triplet_extractor import TripletExtractor
+
+_DONE = object()
+
+
+class StageStats:
+    """Per-stage counters: `busy` sums worker time, `wall` spans first to last item."""
+
+    def __init__(self, name):
+        self.name = name
+        self.docs = 0
+        self.chunks = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, chunks, started, seconds, ok=True, docs=1):
+        with self._lock:
+            if self.started is None or started < self.started:
+                self.started = started
+            end = started + seconds
+            if self.finished is None or end > self.finished:
+                self.finished = end
+            self.busy += seconds
+            if ok:
+                self.docs += docs
+                self.chunks += chunks
+            else:
+                self.errors += 1
+
+    @property
+    def wall(self):
+        if self.started is None:
+            return 0.0
+        return self.finished - self.started
+
+    def summary(self):
+        rate = self.chunks / self.wall if self.wall else 0.0
+        return (
+            f"{self.name:<10}{self.docs:>6}{self.chunks:>9}{self.errors:>8}"
+            f"{self.busy:>10.1f}{self.wall:>10.1f}{rate:>12.1f}"
+        )
+
+
+class IngestionPipeline:
+    """
+    Staged ingestion of many PDFs: parse and split (process pool) -> embed ->
+    extract, connected by bounded queues; progress is kept in an IngestionLedger.
+
+    Hook: `on_done(path)` once every chunk of a file has been written.
+    """
+
+    def __init__(
+        self,
+        parse_workers=None,
+        embed_workers=2,
+        queue_size=4,
+        window_pages=16,
+        driver=None,
+        embedder=None,
+        extractor=None,
+        ledger=None,
+        vector_index=None,
+        on_done=None,
+    ):
+        self.parse_workers = parse_workers or os.cpu_count() or 1
+        self.embed_workers = embed_workers
+        self.queue_size = queue_size
+        self.window_pages = window_pages
+        self.driver = driver or GraphDatabase.driver(
+            os.getenv("NEO4J_URI"),
+            auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+            max_connection_pool_size=max(50, embed_workers * 4),
+        )
+        self.embedder = embedder or CachedEmbeddings(
+            OpenAIEmbeddings(model="text-embedding-3-small")
+        )
+        self.extractor = extractor or TripletExtractor(
+            driver=self.driver, entity_resolver=EntityResolver(embedder=self.embedder)
+        )
+        self.ledger = ledger or IngestionLedger()
+        # Keep an exported local vector index current, if one exists.
+        if vector_index is None and LocalVectorIndex.exists():
+            vector_index = LocalVectorIndex()
+        self.vector_index = vector_index
+        # Called with the PDF path once a document has finished every stage.
+        self.on_done = on_done
+        self.stats = {name: StageStats(name) for name in ("parse", "embed", "extract")}
+
+    def _windows(self, path):
+        """[(start page, stop page, last)] windows of one PDF."""
+        pages = page_count(path)
+        return [
+            (start, start + self.window_pages, start + self.window_pages >= pages)
+            for start in range(0, max(pages, 1), self.window_pages)
+        ]
+
+    def _untracked_chunks(self, path, current_ids):
+        """
+        Chunk ids a file imported from processed.json has in the graph but no
+        longer produces; the ledger never recorded them.
+        """
+        ingestor = DocumentIngestor(
+            str(path),
+            Path(path).stem,
+            driver=self.driver,
+            embedder=self.embedder,
+            vector_index=self.vector_index,
+        )
+        return [cid for cid in ingestor.graph_chunk_ids() if cid not in current_ids]
+
+    def _parse_stage(self, pool, pdf_paths, embed_q):
+        stats = self.stats["parse"]
+        docs = {}  # path -> chunker and progress of a document being parsed
+        running = {}  # future -> (path, last window, submitted at)
+        paths = iter(pdf_paths)
+        # Time blocked on a full embed queue is back-pressure, not parsing.
+        resumed = time.perf_counter()
+
+        def submit(path):
+            # A document's windows run one at a time, each continuing the chunker
+            # the previous one returned; different documents run in parallel.
+            doc = docs[path]
+            start, stop, last = doc["windows"].pop(0)
+            future = pool.submit(
+                split_pages, doc["chunker"], str(path), start, stop, last
+            )
+            running[future] = (path, last, time.perf_counter())
+
+        try:
+            while True:
+                while len(running) < self.parse_workers * 2:
+                    path = next(paths, None)
+                    if path is None:
+                        break
+                    try:
+                        windows = self._windows(path)
+                    except Exception as e:
+                        now = time.perf_counter()
+                        stats.record(0, now, 0.0, ok=False)
+                        print(f"❌ Failed to parse {path}: {e}")
+                        continue
+                    docs[path] = {
+                        "windows": windows,
+                        "chunker": PageChunker(Path(path).stem, str(path)),
+                        "ids": set(),
+                        "parts": 0,
+                    }
+                    self.ledger.start_file(path)
+                    submit(path)
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path, last, started = running.pop(future)
+                    started = max(started, resumed)
+                    doc_id = Path(path).stem
+                    doc = docs[path]
+                    try:
+                        doc["chunker"], pages, chunks = future.result()
+                        if not last:
+                            submit(path)
+                        states = self.ledger.add_chunks(doc_id, chunks)
+                        doc["ids"].update(states)
+                        stale = []
+                        if last:
+                            stale = self.ledger.stale_chunks(doc_id, doc["ids"])
+                            if self.ledger.is_legacy(path):
+                                stale += self._untracked_chunks(path, doc["ids"])
+                    except Exception as e:
+                        elapsed = time.perf_counter() - started
+                        stats.record(0, started, elapsed, ok=False)
+                        print(f"❌ Failed to parse {path}: {e}")
+                        # The file stays unfinished and is parsed again next run;
+                        # later stages learn it has no more batches.
+                        for other, (other_path, _, _) in list(running.items()):
+                            if other_path == path:
+                                other.cancel()
+                                del running[other]
+                        del docs[path]
+                        embed_q.put((path, None, None, None, doc["parts"] + 1))
+                        continue
+                    elapsed = time.perf_counter() - started
+                    stats.record(len(chunks), started, elapsed, docs=int(last))
+                    # Spans opened in the worker process are not collected here.
+                    telemetry.observe(
+                        "parse", elapsed, pages=pages, chunks=len(chunks)
+                    )
+                    if last:
+                        del docs[path]
+                    elif not chunks:
+                        continue
+                    doc["parts"] += 1
+                    parts = None
+                    if last:
+                        parts = doc["parts"]
+                        name = Path(path).name
+                        print(f"📄 Parsed {name}: {len(doc['ids'])} chunks")
+                    embed_q.put((path, chunks, states, stale, parts))
+                    resumed = time.perf_counter()
+        finally:
+            for _ in range(self.embed_workers):
+                embed_q.put(_DONE)
+
+    def _embed_stage(self, embed_q, extract_q):
+        """
+        Items are batches of one document's chunks; `stale` and `parts` (the
+        document's number of batches) are only set on its last batch. A batch
+        whose chunks are None failed in an earlier stage and is passed on.
+        """
+        stats = self.stats["embed"]
+        while True:
+            item = embed_q.get()
+            if item is _DONE:
+                return
+            path, chunks, states, stale, parts = item
+            if chunks is None:
+                extract_q.put((path, None, None, parts))
+                continue
+            to_embed = [c for c in chunks if states[c.metadata["chunk_id"]] == PARSED]
+            started = time.perf_counter()
+            try:
+                ingestor = DocumentIngestor(
+                    str(path),
+                    Path(path).stem,
+                    driver=self.driver,
+                    embedder=self.embedder,
+                    vector_index=self.vector_index,
+                )
+                ingestor.delete_chunks(stale)
+                self.ledger.forget_chunks(stale)
+                if to_embed:
+                    ingestor.ingest(
+                        chunks=to_embed,
+                        on_written=lambda ids: self.ledger.mark(ids, EMBEDDED),
+                    )
+            except Exception as e:
+                stats.record(0, started, time.perf_counter() - started, ok=False)
+                print(f"❌ Failed to ingest {path}: {e}")
+                extract_q.put((path, None, None, parts))
+                continue
+            elapsed = time.perf_counter() - started
+            stats.record(len(to_embed), started, elapsed, docs=int(parts is not None))
+            extract_q.put((path, chunks, states, parts))
+
+    def _extract_batch(self, path, chunks, states, parts):
+        """Extract one batch of a document; returns whether it succeeded."""
+        stats = self.stats["extract"]
+        # Chunks extracted before a crash only need their stored triplets written.
+        resume = [cid for cid, state in states.items() if state == EXTRACTED]
+        to_extract = [
+            c for c in chunks if states[c.metadata["chunk_id"]] in (PARSED, EMBEDDED)
+        ]
+        started = time.perf_counter()
+        try:
+            if resume:
+                stored = self.ledger.load_triplets(resume)
+                self.extractor.insert_batch(
+                    [(cid, triplets) for cid, (triplets, _) in stored.items()],
+                    mentions_only={cid for cid, (_, near) in stored.items() if near},
+                )
+                self.ledger.mark(resume, WRITTEN)
+            self.extractor.process_chunks(
+                to_extract,
+                on_extracted=self.ledger.save_triplets,
+                on_written=lambda ids: self.ledger.mark(ids, WRITTEN),
+            )
+        except Exception as e:
+            stats.record(0, started, time.perf_counter() - started, ok=False)
+            print(f"❌ Failed to extract triplets for {path}: {e}")
+            return False
+        elapsed = time.perf_counter() - started
+        stats.record(len(to_extract), started, elapsed, docs=int(parts is not None))
+        return True
+
+    def _extract_stage(self, extract_q):
+        # Batches seen per document, how many there are once known, and the
+        # documents with a failed batch; embed workers may deliver a document's
+        # batches out of order.
+        done, expected, failed = {}, {}, set()
+        while True:
+            item = extract_q.get()
+            if item is _DONE:
+                return
+            path, chunks, states, parts = item
+            if chunks is None or not self._extract_batch(path, chunks, states, parts):
+                failed.add(path)
+            done[path] = done.get(path, 0) + 1
+            if parts is not None:
+                expected[path] = parts
+            if done[path] != expected.get(path):
+                continue
+            del done[path], expected[path]
+            if path in failed:
+                failed.discard(path)
+                print(f"⚠️ {Path(path).name} stayed unfinished; resuming next run.")
+                continue
+            # This thread must keep draining the queue, or embed workers block
+            # on a full queue and run() never returns.
+            try:
+                if not self.ledger.finish_file(path):
+                    name = Path(path).name
+                    print(f"⚠️ {name} has unfinished chunks; resuming next run.")
+                elif self.on_done is not None:
+                    self.on_done(path)
+            except Exception as e:
+                print(f"❌ Failed to finish {path}: {e}")
+
+    def run(self, pdf_paths):
+        # Spawned, not forked: the embed and extract threads are already running
+        # when the pool starts its workers.
+        pool = ProcessPoolExecutor(
+            max_workers=self.parse_workers, mp_context=get_context("spawn")
+        )
+        embed_q = queue.Queue(maxsize=self.queue_size)
+        extract_q = queue.Queue(maxsize=self.queue_size)
+
+        embedders = [
+            threading.Thread(target=self._embed_stage, args=(embed_q, extract_q))
+            for _ in range(self.embed_workers)
+        ]
+        extractor = threading.Thread(target=self._extract_stage, args=(extract_q,))
+        for t in embedders:
+            t.start()
+        extractor.start()
+
+        try:
+            self._parse_stage(pool, list(pdf_paths), embed_q)
+        finally:
+            for t in embedders:
+                t.join()
+            extract_q.put(_DONE)
+            extractor.join()
+            pool.shutdown(cancel_futures=True)
+        return self.stats
+
+    def print_stats(self):
+        print(
+            f"\n{'stage':<10}{'docs':>6}{'chunks':>9}{'errors':>8}"
+            f"{'busy s':>10}{'wall s':>10}{'chunks/s':>12}"
+        )
+        for stage in self.stats.values():
+            print(stage.summary())
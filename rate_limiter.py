@@ -0,0 +1,86 @@
+import asyncio
+import random
+import time
+
+try:
+    from openai import APIConnectionError, APITimeoutError
+except ImportError:  # pragma: no cover - openai ships with langchain_openai
+    APIConnectionError = APITimeoutError = ()
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucketLimiter:
+    """
+    Async limiter for an API with both a requests-per-minute and a tokens-per-minute
+    quota. Each bucket refills continuously; `acquire` waits until both buckets hold
+    enough capacity for the request.
+    """
+
+    def __init__(self, requests_per_minute=500, tokens_per_minute=200_000):
+        self.rpm = requests_per_minute
+        self.tpm = tokens_per_minute
+        self._requests = float(requests_per_minute)
+        self._tokens = float(tokens_per_minute)
+        self._updated = time.monotonic()
+        self._lock = None
+        self._loop = None
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60.0)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60.0)
+
+    async def acquire(self, tokens=1):
+        # A single request larger than the whole bucket would otherwise wait forever.
+        tokens = min(tokens, self.tpm)
+        # asyncio locks are bound to one event loop; process_chunks may be called
+        # from successive asyncio.run() loops.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._lock = loop, asyncio.Lock()
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._requests >= 1 and self._tokens >= tokens:
+                    self._requests -= 1
+                    self._tokens -= tokens
+                    return
+                wait_requests = (1 - self._requests) * 60.0 / self.rpm
+                wait_tokens = (tokens - self._tokens) * 60.0 / self.tpm
+                await asyncio.sleep(max(wait_requests, wait_tokens, 0.01))
+
+
+def is_retryable(exc):
+    """True for rate limits (429), server errors (5xx) and transient network errors."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS or status >= 500
+    return isinstance(
+        exc, (APIConnectionError, APITimeoutError, asyncio.TimeoutError, ConnectionError)
+    )
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Full-jitter exponential backoff."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+async def retry_async(fn, max_retries=5, base_delay=1.0, on_retry=None):
+    """Await `fn()` and retry retryable failures with jittered exponential backoff."""
+    attempt = 0
+    while True:
+        try:
+            return await fn()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = backoff_delay(attempt, base_delay)
+            if on_retry is not None:
+                on_retry(attempt + 1, delay, e)
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -0,0 +1,181 @@
+import os
+import re
+
+from neo4j import GraphDatabase
+
+VECTOR_INDEX_NAME = "vector"
+EMBEDDING_DIMENSIONS = 1536  # text-embedding-3-small
+SIMILARITY_FUNCTION = "cosine"
+
+CONSTRAINTS = {
+    "chunk_id_unique": ("Chunk", "chunk_id"),
+    "document_source_id_unique": ("Document", "source_id"),
+}
+
+# Queries on the ingest/extract/query hot paths, checked by `explain_hot_queries`.
+HOT_QUERIES = {
+    "chunk merge": (
+        "MATCH (c:Chunk {chunk_id: $chunk_id}) RETURN c",
+        {"chunk_id": "x:0"},
+    ),
+    "document merge": (
+        "MATCH (d:Document {source_id: $doc_id}) RETURN d",
+        {"doc_id": "x"},
+    ),
+    "chunk mentions": (
+        "MATCH (c:Chunk {chunk_id: $cid})-[:MENTIONS]->(n) RETURN n.name",
+        {"cid": "x:0"},
+    ),
+}
+
+_SCAN_OPERATORS = ("NodeByLabelScan", "AllNodesScan")
+
+
+def _plan_operators(plan):
+    """Flatten an EXPLAIN plan (dict or driver Plan object) into (operator, details)."""
+    if plan is None:
+        return []
+    if isinstance(plan, dict):
+        op = plan.get("operatorType", "")
+        args = plan.get("args") or plan.get("arguments") or {}
+        children = plan.get("children", [])
+    else:
+        op = plan.operator_type
+        args = plan.arguments
+        children = plan.children
+    out = [(op.split("@")[0], args.get("Details", ""))]
+    for child in children:
+        out.extend(_plan_operators(child))
+    return out
+
+
+class SchemaManager:
+    """
+    Idempotently creates the constraints and indexes the pipeline relies on:
+    uniqueness on Chunk.chunk_id and Document.source_id, the Chunk.embedding vector
+    index queried by SemanticAgent, and a `name` index for every entity label.
+    """
+
+    def __init__(self, driver=None):
+        self.driver = driver or GraphDatabase.driver(
+            os.getenv("NEO4J_URI"),
+            auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+        )
+
+    def ensure_constraints(self):
+        with self.driver.session() as session:
+            for name, (label, prop) in CONSTRAINTS.items():
+                session.run(
+                    f"CREATE CONSTRAINT {name} IF NOT EXISTS "
+                    f"FOR (n:{label}) REQUIRE n.{prop} IS UNIQUE"
+                ).consume()
+
+    def ensure_vector_index(
+        self, dimensions=EMBEDDING_DIMENSIONS, similarity=SIMILARITY_FUNCTION
+    ):
+        # Index OPTIONS cannot be parameterised, so validate before interpolating.
+        dimensions = int(dimensions)
+        if similarity not in {"cosine", "euclidean"}:
+            raise ValueError(f"Unsupported similarity function: {similarity}")
+        with self.driver.session() as session:
+            session.run(
+                f"""
+                CREATE VECTOR INDEX {VECTOR_INDEX_NAME} IF NOT EXISTS
+                FOR (c:Chunk) ON (c.embedding)
+                OPTIONS {{indexConfig: {{
+                    `vector.dimensions`: {dimensions},
+                    `vector.similarity_function`: '{similarity}'
+                }}}}
+                """
+            ).consume()
+
+    def ensure_name_indexes(self, labels):
+        """Create a `name` index per label; labels must already be Neo4j-safe."""
+        created = []
+        with self.driver.session() as session:
+            for label in dict.fromkeys(labels):
+                if not label or not re.fullmatch(r"\w+", label):
+                    continue
+                session.run(
+                    f"CREATE INDEX `{label.lower()}_name` IF NOT EXISTS "
+                    f"FOR (n:`{label}`) ON (n.name)"
+                ).consume()
+                created.append(label)
+        return created
+
+    def ensure_all(self, entity_types=None):
+        from ontology_store import load_ontology
+        from triplet_extractor import safe_label
+
+        if entity_types is None:
+            entity_types = load_ontology()["entity_types"]
+        self.ensure_constraints()
+        self.ensure_vector_index()
+        labels = self.ensure_name_indexes(safe_label(t) for t in entity_types)
+        print(
+            f"✅ Schema ready: {len(CONSTRAINTS)} constraints, vector index "
+            f"'{VECTOR_INDEX_NAME}', {len(labels)} entity name indexes."
+        )
+
+    def explain_hot_queries(self, sample_label=None):
+        """
+        EXPLAIN each hot query and return {query name: [(operator, details), ...]}
+        for the index seeks or label scans it would use.
+        """
+        queries = dict(HOT_QUERIES)
+        if sample_label:
+            queries[f"entity merge ({sample_label})"] = (
+                f"MATCH (n:{sample_label} {{name: $name}}) RETURN n",
+                {"name": "x"},
+            )
+        report = {}
+        with self.driver.session() as session:
+            for name, (query, params) in queries.items():
+                summary = session.run("EXPLAIN " + query, **params).consume()
+                report[name] = [
+                    (op, details)
+                    for op, details in _plan_operators(summary.plan)
+                    if "Index" in op or op in _SCAN_OPERATORS
+                ]
+            rows = session.run(
+                "SHOW INDEXES YIELD name, type, state, labelsOrTypes, properties "
+                "WHERE name = $name",
+                name=VECTOR_INDEX_NAME,
+            ).data()
+        report["vector search"] = [
+            (
+                f"{r['type']} INDEX {r['name']} ({r['state']})",
+                f"{r['labelsOrTypes']}{r['properties']}",
+            )
+            for r in rows
+        ] or [("missing", f"no index named '{VECTOR_INDEX_NAME}'")]
+        return report
+
+    def print_report(self, sample_label="Ministry"):
+        for name, ops in self.explain_hot_queries(sample_label).items():
+            print(f"\n🔎 {name}")
+            if not ops:
+                print("   (no index or scan operator in plan)")
+            for op, details in ops:
+                marker = "⚠️ " if op in _SCAN_OPERATORS or op == "missing" else "✅"
+                print(f"   {marker} {op}: {details}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Create Neo4j constraints and indexes and report index usage."
+    )
+    parser.add_argument(
+        "--report-only", action="store_true", help="Only print the index report"
+    )
+    args = parser.parse_args()
+
+    manager = SchemaManager()
+    if not args.report_only:
+        manager.ensure_all()
+    manager.print_report()
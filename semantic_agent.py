@@ -1,32 +1,188 @@
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from neo4j import GraphDatabase
+from neo4j import AsyncGraphDatabase, GraphDatabase
+import asyncio
+import logging
 import os
 
+import telemetry
+from answer_cache import AnswerCache
+from context_builder import ContextBuilder
+from embedding_cache import CachedEmbeddings
+from local_vector_index import LocalVectorIndex
+from schema_manager import VECTOR_INDEX_NAME
+
+
+# Vector hits, their mentioned entities and each entity's one-hop neighbours in a
+# single round-trip. Every distinct entity is expanded once, however many hits
+# mention it, and its neighbours are limited to $maxNeighbors inside the subquery.
+# Every collection is ordered so the same graph always yields the same context.
+VECTOR_HITS = """
+CALL db.index.vector.queryNodes($index, $topK, $embedding)
+YIELD node AS c, score
+"""
+
+# Hits found by a LocalVectorIndex, passed in as [{cid, score}].
+LOCAL_HITS = """
+UNWIND $hits AS hit
+MATCH (c:Chunk {chunk_id: hit.cid})
+WITH c, hit.score AS score
+"""
+
+EXPANSION = """
+OPTIONAL MATCH (c)-[:MENTIONS]->(e)
+WHERE NOT e:Chunk AND e.name IS NOT NULL
+WITH collect({c: c, score: score, e: e}) AS pairs, collect(DISTINCT e) AS entities
+CALL {
+    WITH entities
+    UNWIND entities AS e
+    CALL {
+        WITH e
+        MATCH (e)-[rel]->(n)
+        WHERE NOT n:Chunk AND n.name IS NOT NULL
+        WITH rel, n
+        ORDER BY type(rel), n.name
+        LIMIT $maxNeighbors
+        RETURN collect({rel_type: type(rel), name: n.name, label: labels(n)[0]})
+            AS facts
+    }
+    RETURN collect({entity: e, degree: COUNT { (e)--() }, facts: facts}) AS expanded
+}
+UNWIND pairs AS pair
+WITH pair.c AS c, pair.score AS score, pair.e AS e,
+    [x IN expanded WHERE x.entity = pair.e][0] AS x
+ORDER BY e.name
+WITH c, score, collect(
+    CASE WHEN e IS NULL THEN null
+    ELSE {name: e.name, label: labels(e)[0], degree: x.degree, facts: x.facts}
+    END
+) AS mentions
+RETURN c.chunk_id AS cid, c.text AS chunk, score, mentions
+ORDER BY score DESC, cid
+"""
+
+RETRIEVAL_QUERY = VECTOR_HITS + EXPANSION
+LOCAL_RETRIEVAL_QUERY = LOCAL_HITS + EXPANSION
+
+# Legacy mode: one query per retrieved chunk, then one per mentioned entity.
+MENTIONS_QUERY = """
+MATCH (c:Chunk {chunk_id: $cid})-[:MENTIONS]->(n)
+WHERE NOT 'Chunk' IN labels(n)
+RETURN n.name AS name, labels(n) AS labels
+"""
+
+ENTITY_EXPANSION_QUERY = """
+MATCH (e:{typ} {{name: $name}})-[rel]->(n)
+WHERE NOT 'Chunk' IN labels(n)
+RETURN e.name AS entity_name, labels(e) AS entity_type,
+    type(rel) AS rel_type, n.name AS neighbor_name, labels(n) AS neighbor_type
+"""
+
+NO_RESULTS = "🕵️ No relevant information found in the knowledge graph."
+
+
+def _expansion_triple(row):
+    return f"{row['entity_name']} ({row['entity_type'][0] if row['entity_type'] else ''}) --[{row['rel_type']}]--> {row['neighbor_name']} ({row['neighbor_type'][0] if row['neighbor_type'] else ''})"
+
 
 class SemanticAgent:
-    def __init__(self):
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
-        self.llm = ChatOpenAI(model="gpt-4.1-nano", temperature=0)
-        self.driver = GraphDatabase.driver(
+    """
+    Answers questions from the graph. `query_mode="single"` (default) fetches the
+    vector hits, mentions and +1-hop facts with one Cypher statement;
+    `query_mode="legacy"` keeps the original one-query-per-chunk/entity path for
+    comparison.
+
+    With `retrieval_backend="local"`, the top-k search runs in-process against a
+    LocalVectorIndex (exact, or IVF when `n_probe` is set) and Neo4j is only asked
+    for the graph context of the hits.
+
+    Answers are cached by question embedding (`answer_cache`); pass
+    `answer_cache=False` to always run the full pipeline. The prompt context is
+    ranked and packed into `context_token_budget` tokens (None disables packing).
+
+    `arun_query` / `astream_query` are the asyncio equivalents of `run_query`,
+    built on the async Neo4j driver and `aembed_query` / `astream`, for serving
+    many concurrent questions from one event loop. An agent given a `driver` needs
+    an `async_driver` for the same database to use them.
+    """
+
+    def __init__(
+        self,
+        query_mode="single",
+        top_k=10,
+        max_neighbors=25,
+        retrieval_backend="neo4j",
+        vector_index=None,
+        n_probe=None,
+        answer_cache=None,
+        context_token_budget=4000,
+        embeddings=None,
+        llm=None,
+        driver=None,
+        async_driver=None,
+    ):
+        self.embeddings = embeddings or CachedEmbeddings(
+            OpenAIEmbeddings(model="text-embedding-3-small")
+        )
+        self.llm = llm or ChatOpenAI(model="gpt-4.1-nano", temperature=0)
+        self.driver = driver or GraphDatabase.driver(
             os.getenv("NEO4J_URI"),
             auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
         )
+        self.query_mode = query_mode
+        self.top_k = top_k
+        # Cap on one-hop facts per mentioned entity (single mode only).
+        self.max_neighbors = max_neighbors
+        self.retrieval_backend = retrieval_backend
+        self.n_probe = n_probe
+        self.vector_index = vector_index
+        if retrieval_backend == "local" and vector_index is None:
+            self.vector_index = LocalVectorIndex()
+        if answer_cache is None:
+            answer_cache = AnswerCache()
+        self.answer_cache = answer_cache or None
+        self.context_builder = ContextBuilder(context_token_budget)
+        self.last_context_stats = None
+        # Without either driver, both are built from the same NEO4J_* settings.
+        self._async_driver = async_driver
+        self._injected_driver = driver is not None
+
+    @property
+    def async_driver(self):
+        # Created on first use so sync-only callers never open a second pool.
+        if self._async_driver is None:
+            if self._injected_driver:
+                raise RuntimeError(
+                    "SemanticAgent was given a driver but no async_driver; pass "
+                    "async_driver= to use the async API against the same database"
+                )
+            self._async_driver = AsyncGraphDatabase.driver(
+                os.getenv("NEO4J_URI"),
+                auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+            )
+        return self._async_driver
+
+    async def aclose(self):
+        if self._async_driver is not None:
+            await self._async_driver.close()
+            self._async_driver = None
 
     def get_relevant_chunks(self, question, top_k=10):
         embedding = self.embeddings.embed_query(question)
         with self.driver.session() as session:
             result = session.run(
                 """
-                CALL db.index.vector.queryNodes('vector', $topK, $embedding)
+                CALL db.index.vector.queryNodes($index, $topK, $embedding)
                 YIELD node, score
                 RETURN node.chunk_id AS cid, node.text AS chunk, score
                 ORDER BY score DESC
                 LIMIT $topK
                 """,
+                index=VECTOR_INDEX_NAME,
                 embedding=embedding,
                 topK=top_k,
             )
             chunks = [{"id": row["cid"], "text": row["chunk"]} for row in result]
+            telemetry.count("db_round_trips", stage="query")
             return chunks
 
     def get_neighbor_triples(self, chunk_ids):
@@ -72,10 +228,68 @@ class SemanticAgent:
                         )
             return expansion_triples
 
-    def run_query(self, question):
-        chunks = self.get_relevant_chunks(question)
+    def retrieve(self, question, embedding=None):
+        """
+        Single round-trip retrieval. Returns (chunks, chunk_to_mentions,
+        expansion_triples, fact_meta) in the same shape as the legacy path;
+        fact_meta maps each fact to its entity degree and best chunk score.
+        """
+        if embedding is None:
+            embedding = self.embeddings.embed_query(question)
+        prepared = self._retrieval_query(embedding)
+        if prepared is None:
+            return [], {}, [], {}
+        query, params = prepared
+        with self.driver.session() as session:
+            records = session.execute_read(lambda tx: list(tx.run(query, **params)))
+        telemetry.count("db_round_trips", stage="query")
+        return self._parse_retrieval(records)
+
+    def _retrieval_query(self, embedding):
+        """Pick the single-query statement and parameters for the backend."""
+        if self.retrieval_backend == "local":
+            with telemetry.span("query.search"):
+                hits = self.vector_index.search(embedding, self.top_k, self.n_probe)
+            if not hits:
+                return None
+            query = LOCAL_RETRIEVAL_QUERY
+            params = {"hits": [{"cid": cid, "score": score} for cid, score in hits]}
+        else:
+            query = RETRIEVAL_QUERY
+            params = {
+                "index": VECTOR_INDEX_NAME,
+                "topK": self.top_k,
+                "embedding": embedding,
+            }
+        return query, dict(params, maxNeighbors=self.max_neighbors)
+
+    def _parse_retrieval(self, records):
+        chunks, chunk_to_mentions, expansion_triples = [], {}, []
+        fact_meta = {}
+        for row in records:
+            chunks.append(
+                {"id": row["cid"], "text": row["chunk"], "score": row["score"]}
+            )
+            mentions = []
+            for m in row["mentions"]:
+                entity = f"{m['name']} ({m['label'] or ''})"
+                mentions.append(entity)
+                for f in m["facts"]:
+                    neighbour = f"{f['name']} ({f['label'] or ''})"
+                    fact = f"{entity} --[{f['rel_type']}]--> {neighbour}"
+                    expansion_triples.append(fact)
+                    # Rows arrive best-scored first, so keep the first score seen.
+                    fact_meta.setdefault(
+                        fact, {"score": row["score"], "degree": m["degree"]}
+                    )
+            chunk_to_mentions[row["cid"]] = mentions
+        expansion_triples = list(dict.fromkeys(expansion_triples))
+        return chunks, chunk_to_mentions, expansion_triples, fact_meta
+
+    def retrieve_legacy(self, question):
+        chunks = self.get_relevant_chunks(question, self.top_k)
         if not chunks:
-            return "🕵️ No relevant information found in the knowledge graph."
+            return chunks, {}, [], {}
         chunk_ids = [c["id"] for c in chunks]
 
         # Step 1: Gather mentions for each chunk (not Chunks)
@@ -84,14 +298,8 @@ class SemanticAgent:
             entity_ids = set()
             for cid in chunk_ids:
                 mentions = []
-                result = session.run(
-                    """
-                    MATCH (c:Chunk {chunk_id: $cid})-[:MENTIONS]->(n)
-                    WHERE NOT 'Chunk' IN labels(n)
-                    RETURN n.name AS name, labels(n) AS labels
-                    """,
-                    cid=cid,
-                )
+                result = session.run(MENTIONS_QUERY, cid=cid)
+                telemetry.count("db_round_trips", stage="query")
                 for row in result:
                     if row["name"]:
                         label = row["labels"][0] if row["labels"] else ""
@@ -104,45 +312,35 @@ class SemanticAgent:
         with self.driver.session() as session:
             for name, typ in entity_ids:
                 result = session.run(
-                    f"""
-                    MATCH (e:{typ} {{name: $name}})-[rel]->(n)
-                    WHERE NOT 'Chunk' IN labels(n)
-                    RETURN e.name AS entity_name, labels(e) AS entity_type,
-                        type(rel) AS rel_type, n.name AS neighbor_name, labels(n) AS neighbor_type
-                    """,
-                    name=name,
+                    ENTITY_EXPANSION_QUERY.format(typ=typ), name=name
                 )
+                telemetry.count("db_round_trips", stage="query")
                 for row in result:
                     if row["rel_type"] and row["neighbor_name"]:
-                        expansion_triples.append(
-                            f"{row['entity_name']} ({row['entity_type'][0] if row['entity_type'] else ''}) --[{row['rel_type']}]--> {row['neighbor_name']} ({row['neighbor_type'][0] if row['neighbor_type'] else ''})"
-                        )
+                        expansion_triples.append(_expansion_triple(row))
         # Deduplicate
         expansion_triples = list(dict.fromkeys(expansion_triples))
+        return chunks, chunk_to_mentions, expansion_triples, {}
 
-        # Step 3: Compose context
-        context_sections = []
-        for c in chunks:
-            section = c["text"] + "\nMentions in this chunk:"
-            mentions = chunk_to_mentions.get(c["id"], [])
-            if mentions:
-                for m in mentions:
-                    section += f"\n- {m}"
-            else:
-                section += "\n- (none)"
-            context_sections.append(section)
-
-        # At the end: All expanded facts
-        if expansion_triples:
-            context_sections.append(
-                "Additional facts from knowledge graph:\n"
-                + "\n".join(expansion_triples)
-            )
+    def _prepare_prompt(self, question, retrieved):
+        """Rank and pack the retrieved context; returns None if nothing was found."""
+        chunks, chunk_to_mentions, expansion_triples, fact_meta = retrieved
+        if not chunks:
+            return None
 
-        context = "\n\n---\n\n".join(context_sections)
-        print("------\n" + context + "\n------")
+        # Step 3: Rank and pack the context into the token budget
+        context, stats = self.context_builder.build(
+            question, chunks, chunk_to_mentions, expansion_triples, fact_meta
+        )
+        self.last_context_stats = stats
+        logging.info(
+            f"Context: {stats['tokens']}/{stats['full_tokens']} tokens "
+            f"(saved {stats['saved_tokens']}), chunks {stats['chunks']}, "
+            f"facts {stats['facts']}"
+        )
+        logging.debug("------\n" + context + "\n------")
 
-        prompt = f"""Answer the following question using only the information in the context below.
+        return f"""Answer the following question using only the information in the context below.
 
     Question: {question}
 
@@ -150,5 +348,174 @@ class SemanticAgent:
     {context}
 
     Answer:"""
-        response = self.llm.invoke(prompt)
-        return getattr(response, "content", str(response))
+
+    def _remember(self, question, embedding, answer, chunks):
+        if self.answer_cache is not None:
+            self.answer_cache.store(
+                question, embedding, answer, [c["id"] for c in chunks]
+            )
+
+    def run_query(self, question, mode=None):
+        mode = mode or self.query_mode
+        with telemetry.span("query", mode=mode) as span:
+            with telemetry.span("query.embed"):
+                embedding = self.embeddings.embed_query(question)
+            if self.answer_cache is not None:
+                with telemetry.span("query.cache"):
+                    cached = self.answer_cache.lookup(embedding)
+                if cached is not None:
+                    span.set(cached=True)
+                    return cached
+
+            with telemetry.span("query.retrieve"):
+                if mode == "legacy":
+                    retrieved = self.retrieve_legacy(question)
+                else:
+                    retrieved = self.retrieve(question, embedding)
+            with telemetry.span("query.context"):
+                prompt = self._prepare_prompt(question, retrieved)
+            if prompt is None:
+                return NO_RESULTS
+
+            with telemetry.span("query.generate"):
+                response = self.llm.invoke(prompt)
+            telemetry.record_usage(response, "query", len(prompt) // 4)
+            answer = getattr(response, "content", str(response))
+            self._remember(question, embedding, answer, retrieved[0])
+            return answer
+
+    # --- asyncio API -------------------------------------------------------
+
+    async def _aread(self, query, **params):
+        # One session per query: async sessions must not be shared between tasks.
+        telemetry.count("db_round_trips", stage="query")
+        async with self.async_driver.session() as session:
+            result = await session.run(query, **params)
+            return [row async for row in result]
+
+    async def aretrieve(self, question, embedding=None):
+        if embedding is None:
+            embedding = await self.embeddings.aembed_query(question)
+        # The local index search is CPU-bound, so run it off the event loop.
+        prepared = await asyncio.to_thread(self._retrieval_query, embedding)
+        if prepared is None:
+            return [], {}, [], {}
+        query, params = prepared
+        return self._parse_retrieval(await self._aread(query, **params))
+
+    async def aretrieve_legacy(self, question, embedding=None):
+        """Legacy retrieval with the per-chunk and per-entity lookups run concurrently."""
+        if embedding is None:
+            embedding = await self.embeddings.aembed_query(question)
+        rows = await self._aread(
+            """
+            CALL db.index.vector.queryNodes($index, $topK, $embedding)
+            YIELD node, score
+            RETURN node.chunk_id AS cid, node.text AS chunk, score
+            ORDER BY score DESC
+            """,
+            index=VECTOR_INDEX_NAME,
+            topK=self.top_k,
+            embedding=embedding,
+        )
+        chunks = [{"id": row["cid"], "text": row["chunk"]} for row in rows]
+        if not chunks:
+            return chunks, {}, [], {}
+
+        mention_rows = await asyncio.gather(
+            *(self._aread(MENTIONS_QUERY, cid=c["id"]) for c in chunks)
+        )
+        chunk_to_mentions = {}
+        entity_ids = {}
+        for c, rows in zip(chunks, mention_rows):
+            mentions = []
+            for row in rows:
+                if row["name"]:
+                    label = row["labels"][0] if row["labels"] else ""
+                    mentions.append(f"{row['name']} ({label})")
+                    entity_ids[(row["name"], label)] = None
+            chunk_to_mentions[c["id"]] = mentions
+
+        expansion_rows = await asyncio.gather(
+            *(
+                self._aread(ENTITY_EXPANSION_QUERY.format(typ=typ), name=name)
+                for name, typ in entity_ids
+            )
+        )
+        expansion_triples = [
+            _expansion_triple(row)
+            for rows in expansion_rows
+            for row in rows
+            if row["rel_type"] and row["neighbor_name"]
+        ]
+        expansion_triples = list(dict.fromkeys(expansion_triples))
+        return chunks, chunk_to_mentions, expansion_triples, {}
+
+    async def astream_query(self, question, mode=None):
+        """Yield the answer as it is generated (a cached answer arrives in one piece)."""
+        mode = mode or self.query_mode
+        # Spans are only made current between yields, so a consumer that abandons
+        # the stream is never left with one of them as its current span.
+        query_span = telemetry.span("query", mode=mode).start()
+        error = None
+        try:
+            cached = prompt = None
+            with query_span.active():
+                with telemetry.span("query.embed"):
+                    embedding = await self.embeddings.aembed_query(question)
+                if self.answer_cache is not None:
+                    with telemetry.span("query.cache"):
+                        cached = await asyncio.to_thread(
+                            self.answer_cache.lookup, embedding
+                        )
+                if cached is None:
+                    with telemetry.span("query.retrieve"):
+                        if mode == "legacy":
+                            retrieve = self.aretrieve_legacy
+                        else:
+                            retrieve = self.aretrieve
+                        retrieved = await retrieve(question, embedding)
+                    with telemetry.span("query.context"):
+                        prompt = await asyncio.to_thread(
+                            self._prepare_prompt, question, retrieved
+                        )
+            if cached is not None:
+                query_span.set(cached=True)
+                yield cached
+                return
+            if prompt is None:
+                yield NO_RESULTS
+                return
+
+            parts = []
+            stream = self.llm.astream(prompt)
+            # Includes the time the caller spends between tokens.
+            with query_span.active():
+                generate_span = telemetry.span("query.generate").start()
+            try:
+                while True:
+                    with generate_span.active():
+                        try:
+                            chunk = await stream.__anext__()
+                        except StopAsyncIteration:
+                            break
+                    text = getattr(chunk, "content", str(chunk))
+                    if text:
+                        parts.append(text)
+                        yield text
+            finally:
+                generate_span.end()
+            answer = "".join(parts)
+            telemetry.record_usage(answer, "query", len(prompt) // 4)
+            with query_span.active():
+                await asyncio.to_thread(
+                    self._remember, question, embedding, answer, retrieved[0]
+                )
+        except Exception as exc:
+            error = type(exc)
+            raise
+        finally:
+            query_span.end(error)
+
+    async def arun_query(self, question, mode=None):
+        return "".join([part async for part in self.astream_query(question, mode)])
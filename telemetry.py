@@ -0,0 +1,390 @@
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import random
+import secrets
+import threading
+import time
+
+# Set KG_TELEMETRY=1 to record spans and counters for the whole process, and
+# KG_TELEMETRY_FILE to write them on exit (.json: OpenTelemetry, else Prometheus).
+SERVICE_NAME = "knowledge-graph"
+METRIC_PREFIX = "kg_"
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current = contextvars.ContextVar("telemetry_span", default=None)
+
+
+class _NoopSpan:
+    """Returned by `span` while telemetry is disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def start(self):
+        return self
+
+    def end(self, exc_type=None):
+        pass
+
+    def active(self):
+        return self
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """A timed operation; spans opened inside it (also in child tasks) nest under it."""
+
+    def __init__(self, collector, name, attrs):
+        self.collector = collector
+        self.name = name
+        self.attrs = attrs
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.start()
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # Closed from another context, e.g. an abandoned async generator.
+            pass
+        self.end(exc_type)
+        return False
+
+    def start(self):
+        """Start timing under the current span without becoming current itself."""
+        parent = _current.get()
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = secrets.token_hex(8)
+        self.start_ns = time.time_ns()
+        self._started = time.perf_counter()
+        return self
+
+    def end(self, exc_type=None):
+        self.duration = time.perf_counter() - self._started
+        self.end_ns = self.start_ns + int(self.duration * 1e9)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.collector.finish(self)
+
+    @contextlib.contextmanager
+    def active(self):
+        """
+        Make a started span the parent of spans opened in the block. Generators use
+        this between yields, so a consumer never sees one of their spans as current.
+        """
+        token = _current.set(self)
+        try:
+            yield self
+        finally:
+            _current.reset(token)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+
+def _quantile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class _Durations:
+    """Streaming count, sum and max of one span name plus a reservoir sample."""
+
+    def __init__(self, max_samples):
+        self.max_samples = max_samples
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = []
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.samples) < self.max_samples:
+            self.samples.append(value)
+        else:
+            i = random.randrange(self.count)
+            if i < self.max_samples:
+                self.samples[i] = value
+
+    def snapshot(self):
+        return self.count, self.total, self.max, list(self.samples)
+
+
+def _labels(labels):
+    return ",".join(f'{k}="{v}"' for k, v in labels)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attrs):
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items()]
+
+
+class Collector:
+    """
+    In-process store of finished spans (up to `max_spans`, for trace export),
+    per-name durations and labelled counters. Quantiles come from a sample of up
+    to `max_samples` durations per name; counts, sums and maxima are exact.
+    """
+
+    def __init__(self, max_spans=100_000, max_samples=10_000):
+        self.max_spans = max_spans
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.spans = []
+        self.dropped_spans = 0
+        self.durations = {}
+        self.counters = {}
+
+    def finish(self, span):
+        with self._lock:
+            durations = self.durations.get(span.name)
+            if durations is None:
+                durations = self.durations[span.name] = _Durations(self.max_samples)
+            durations.add(span.duration)
+            if len(self.spans) < self.max_spans:
+                self.spans.append(span)
+            else:
+                self.dropped_spans += 1
+
+    def count(self, name, value, labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def prometheus(self):
+        """Prometheus text exposition: a summary per span name, plus counters."""
+        lines = [
+            f"# HELP {METRIC_PREFIX}span_seconds Time spent in instrumented stages.",
+            f"# TYPE {METRIC_PREFIX}span_seconds summary",
+        ]
+        with self._lock:
+            durations = {k: v.snapshot() for k, v in self.durations.items()}
+            counters = dict(self.counters)
+        for name, (calls, total, _, values) in sorted(durations.items()):
+            for q in QUANTILES:
+                lines.append(
+                    f'{METRIC_PREFIX}span_seconds{{span="{name}",quantile="{q}"}} '
+                    f"{_quantile(values, q):.6f}"
+                )
+            lines.append(
+                f'{METRIC_PREFIX}span_seconds_sum{{span="{name}"}} {total:.6f}'
+            )
+            lines.append(f'{METRIC_PREFIX}span_seconds_count{{span="{name}"}} {calls}')
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            metric = f"{METRIC_PREFIX}{name}_total"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            suffix = f"{{{_labels(labels)}}}" if labels else ""
+            lines.append(f"{metric}{suffix} {value}")
+        return "\n".join(lines) + "\n"
+
+    def otlp(self):
+        """Spans and counters in the OTLP/JSON layout of OpenTelemetry collectors."""
+        resource = {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})}
+        scope = {"name": "telemetry"}
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+        now = str(time.time_ns())
+        otlp_spans = [
+            {
+                "traceId": s.trace_id,
+                "spanId": s.span_id,
+                "parentSpanId": s.parent_id or "",
+                "name": s.name,
+                "kind": 1,
+                "startTimeUnixNano": str(s.start_ns),
+                "endTimeUnixNano": str(s.end_ns),
+                "attributes": _otlp_attributes(s.attrs),
+                "status": {"code": 2 if "error" in s.attrs else 0},
+            }
+            for s in spans
+        ]
+        points = {}
+        for (name, labels), value in sorted(counters.items()):
+            points.setdefault(name, []).append(
+                {
+                    "attributes": _otlp_attributes(dict(labels)),
+                    "timeUnixNano": now,
+                    "asInt": str(value),
+                }
+            )
+        metrics = [
+            {
+                "name": f"{METRIC_PREFIX}{name}",
+                "sum": {
+                    "aggregationTemporality": 2,
+                    "isMonotonic": True,
+                    "dataPoints": data_points,
+                },
+            }
+            for name, data_points in points.items()
+        ]
+        return {
+            "resourceSpans": [
+                {
+                    "resource": resource,
+                    "scopeSpans": [{"scope": scope, "spans": otlp_spans}],
+                }
+            ],
+            "resourceMetrics": [
+                {
+                    "resource": resource,
+                    "scopeMetrics": [{"scope": scope, "metrics": metrics}],
+                }
+            ],
+        }
+
+    def report(self):
+        """Per-stage breakdown, nested by dotted span name, then the counters."""
+        with self._lock:
+            durations = {k: v.snapshot() for k, v in self.durations.items()}
+            counters = dict(self.counters)
+        lines = [
+            f"{'stage':<30}{'calls':>8}{'total s':>10}{'mean ms':>10}"
+            f"{'p95 ms':>10}{'max ms':>10}"
+        ]
+        for name, (calls, total, longest, values) in sorted(durations.items()):
+            label = "  " * name.count(".") + name
+            lines.append(
+                f"{label:<30}{calls:>8}{total:>10.2f}"
+                f"{total / calls * 1000:>10.1f}"
+                f"{_quantile(values, 0.95) * 1000:>10.1f}{longest * 1000:>10.1f}"
+            )
+        if counters:
+            lines.append(f"\n{'counter':<48}{'value':>10}")
+            for (name, labels), value in sorted(counters.items()):
+                label = name + (f"{{{_labels(labels)}}}" if labels else "")
+                lines.append(f"{label:<48}{value:>10}")
+        return "\n".join(lines)
+
+
+_collector = Collector()
+_enabled = False
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    _collector.reset()
+
+
+def span(name, **attrs):
+    """
+    Context manager timing `name` (a dotted stage such as "ingest.embed"). While
+    telemetry is disabled this returns a shared no-op object.
+    """
+    if not _enabled:
+        return _NOOP
+    return Span(_collector, name, attrs)
+
+
+def count(name, value=1, **labels):
+    """Add `value` to the counter `name` with the given labels."""
+    if _enabled:
+        _collector.count(name, value, labels)
+
+
+def observe(name, seconds, **attrs):
+    """Record an operation timed elsewhere (e.g. in a worker process) as a span."""
+    if not _enabled:
+        return
+    s = Span(_collector, name, attrs)
+    parent = _current.get()
+    s.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+    s.parent_id = parent.span_id if parent else None
+    s.span_id = secrets.token_hex(8)
+    s.duration = seconds
+    s.end_ns = time.time_ns()
+    s.start_ns = s.end_ns - int(seconds * 1e9)
+    _collector.finish(s)
+
+
+def record_usage(message, stage, prompt_tokens=0):
+    """
+    Count the prompt and completion tokens of an LLM response (a message or the
+    answer text) from its usage metadata. Without metadata the prompt counts as
+    the caller's `prompt_tokens` estimate and the completion as ~4 characters
+    per token.
+    """
+    if not _enabled:
+        return
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        prompt, completion = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    else:
+        content = getattr(message, "content", message)
+        prompt = prompt_tokens
+        completion = len(content if isinstance(content, str) else str(content)) // 4
+    _collector.count("llm_tokens", prompt, {"stage": stage, "kind": "prompt"})
+    _collector.count("llm_tokens", completion, {"stage": stage, "kind": "completion"})
+
+
+def report():
+    return _collector.report()
+
+
+def print_report():
+    print("\n📊 Profile")
+    print(report())
+
+
+def export(path, fmt=None):
+    """Write spans and counters to `path` as "otlp" JSON or "prometheus" text."""
+    fmt = fmt or ("otlp" if str(path).endswith(".json") else "prometheus")
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "otlp":
+            json.dump(_collector.otlp(), f, indent=2)
+        else:
+            f.write(_collector.prometheus())
+
+
+if os.getenv("KG_TELEMETRY", "").lower() in {"1", "true", "yes"}:
+    enable()
+if os.getenv("KG_TELEMETRY_FILE"):
+    enable()
+    atexit.register(export, os.environ["KG_TELEMETRY_FILE"])
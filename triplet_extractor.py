@@ -1,5 +1,6 @@
 import os
-import ast
+import asyncio
+import hashlib
 import json
 from typing import List, Tuple
 from dotenv import load_dotenv
@@ -8,46 +9,31 @@ from langchain_openai import ChatOpenAI
 from langchain_core.prompts import PromptTemplate
 import re
 
-load_dotenv()
-
-ONTOLOGY_PATH = "ontology.json"
-
-
-def load_ontology():
-    with open(ONTOLOGY_PATH, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-
-def save_ontology(ontology):
-    with open(ONTOLOGY_PATH, "w", encoding="utf-8") as f:
-        json.dump(ontology, f, indent=2, ensure_ascii=False)
-
-
-def safe_label(label):
-    label = label.strip().title()
-    label = re.sub(r"[\s\-]", "", label)  # Remove space and hyphen
-    label = re.sub(r"\W", "", label)  # Remove all non-word chars
-    return label
+import telemetry
+from answer_cache import invalidate_chunks
+from entity_resolver import EntityResolver
+from extraction_cache import ExtractionCache, MinHashLSH
+from ontology_store import OntologyStore
+from rate_limiter import TokenBucketLimiter, retry_async
+from schema_manager import SchemaManager
+from triplet_parser import (
+    TRIPLET_RESPONSE_FORMAT,
+    parse_packed_output,
+    parse_triplet_output,
+)
 
+load_dotenv()
 
-class TripletExtractor:
-    def __init__(self):
-        self.driver = GraphDatabase.driver(
-            os.getenv("NEO4J_URI"),
-            auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
-        )
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+# (ontology path, ontology version) -> (single-chunk prompt, packed prompt)
+_prompt_cache = {}
 
-        # Load ontology and store as class variables
-        self.ontology = load_ontology()
-        self.entity_types = self.ontology["entity_types"]
-        self.relation_types = self.ontology["relation_types"]
 
-        entity_types_str = ", ".join(self.entity_types)
-        relation_types_str = ", ".join(self.relation_types)
+def build_prompts(entity_types, relation_types):
+    """Single-chunk and packed extraction prompts for an ontology."""
+    entity_types_str = ", ".join(entity_types)
+    relation_types_str = ", ".join(relation_types)
 
-        self.prompt = PromptTemplate.from_template(
-            f"""
+    instructions = f"""
 You are an expert in extracting structured information from Indian government documents.
 
 Extract all factual relationships from the text below as [SUBJECT, SUBJECT_TYPE, RELATION, OBJECT, OBJECT_TYPE].
@@ -68,115 +54,605 @@ output:
 ["Fiscal Responsibility Act", "policy", "start_date", "1 Feb 2024", "date"],
 ["PMJDY", "scheme", "implemented_by", "Department of Financial Services", "department"]
 ]
+"""
+    prompt = PromptTemplate.from_template(
+        instructions
+        + """
+Now process this:
+```{text}```
+output:
+        """
+    )
+    # Packed mode: several chunks per request, answered as one JSON object.
+    packed_prompt = PromptTemplate.from_template(
+        instructions
+        + """
+The text below contains several chunks, each starting with a line "### CHUNK <id>".
+Extract the relationships of every chunk separately and answer with a single JSON object mapping each chunk id to its list of triplets, with an empty list for a chunk without facts:
+{{"1": [["Ministry of Finance", "ministry", "has_minister", "Nirmala Sitharaman", "person"]], "2": []}}
 
 Now process this:
-```{{text}}```
+{text}
 output:
-            """
+        """
+    )
+    return prompt, packed_prompt
+
+
+def safe_label(label):
+    label = label.strip().title()
+    label = re.sub(r"[\s\-]", "", label)  # Remove space and hyphen
+    label = re.sub(r"\W", "", label)  # Remove all non-word chars
+    return label
+
+
+def safe_rel_type(rel):
+    rel = rel.strip().upper().replace(" ", "_").replace("-", "_")
+    return re.sub(r"\W", "", rel)
+
+
+def quote_name(name):
+    """Backtick-quote a label or relationship type, e.g. one starting with a digit."""
+    return "`" + name.replace("`", "``") + "`"
+
+
+class TripletExtractor:
+    def __init__(
+        self,
+        max_concurrency=8,
+        requests_per_minute=500,
+        tokens_per_minute=200_000,
+        max_retries=5,
+        write_queue_size=32,
+        write_batch_chunks=1,
+        driver=None,
+        extraction_cache=None,
+        pack_token_budget=None,
+        llm=None,
+        structured_output=False,
+        entity_resolver=None,
+        ontology=None,
+    ):
+        self.driver = driver or GraphDatabase.driver(
+            os.getenv("NEO4J_URI"),
+            auth=(os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD")),
+        )
+        # Retries are handled by retry_async so they share the rate limiter.
+        self.llm = llm or ChatOpenAI(
+            model="gpt-4o-mini", temperature=0, max_retries=0
         )
-        self.chain = self.prompt | self.llm
+        self.schema = SchemaManager(self.driver)
+        # Surface forms are mapped to canonical entities before every write;
+        # pass entity_resolver=False to MERGE on the names as extracted.
+        if entity_resolver is None:
+            entity_resolver = EntityResolver()
+        self.entity_resolver = entity_resolver or None
 
-    def parse_triplets(self, raw_output: str):
-        """Parse and return triplets, track any new types for ontology update."""
-        cleaned = (
-            raw_output.replace("```json", "")
-            .replace("```", "")
-            .replace("\n", "")
-            .strip()
+        # Concurrency, rate-limit and pipeline settings for process_chunks
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.write_queue_size = write_queue_size
+        # Chunks whose triplets are written together in one Neo4j transaction
+        self.write_batch_chunks = write_batch_chunks
+        self.rate_limiter = TokenBucketLimiter(requests_per_minute, tokens_per_minute)
+        # Chunk tokens packed into one request; None sends one chunk per request.
+        self.pack_token_budget = pack_token_budget
+
+        # Shared, versioned ontology; proposed types are matched by embedding too
+        # when the entity resolver provides an embedder.
+        self.ontology = ontology or OntologyStore(
+            embedder=self.entity_resolver.embedder if self.entity_resolver else None
         )
-        print("📥 Cleaned raw input to eval:\n", cleaned)
-        try:
-            triplet_list = ast.literal_eval(cleaned)
-        except Exception as e:
-            print("⚠️ Failed to parse structured triplets:", e)
-            return [], set(), set()
+        # Structured output constrains single-chunk responses to a JSON schema.
+        self.structured_output = structured_output
+        # Raw responses are appended here (JSON lines) for parser benchmarks.
+        self.response_log = os.getenv("TRIPLET_RESPONSE_LOG")
+
+        # Triplets are reused for chunks already extracted with the same model and
+        # prompt; pass extraction_cache=False to send every chunk to the LLM.
+        if extraction_cache is None:
+            extraction_cache = ExtractionCache()
+        self.extraction_cache = extraction_cache or None
+        self.model_name = self.llm.model_name
+        self.ontology_version = None
+        self.refresh_prompts()
 
+    def refresh_prompts(self):
+        """
+        (Re)build the extraction chains if the ontology version changed. Prompts are
+        shared by every extractor in the process, per ontology version.
+        """
+        self.ontology.refresh()
+        if self.ontology.version == self.ontology_version:
+            return
+        cache_key = (str(self.ontology.path), self.ontology.version)
+        if cache_key not in _prompt_cache:
+            _prompt_cache[cache_key] = build_prompts(
+                self.ontology.entity_types, self.ontology.relation_types
+            )
+        self.prompt, self.packed_prompt = _prompt_cache[cache_key]
+        self.ontology_version = self.ontology.version
+
+        if self.structured_output:
+            self.chain = self.prompt | self.llm.bind(
+                response_format=TRIPLET_RESPONSE_FORMAT
+            )
+        else:
+            self.chain = self.prompt | self.llm
+        self.packed_chain = self.packed_prompt | self.llm.bind(
+            response_format={"type": "json_object"}
+        )
+        # Rough token cost of the fixed instructions, used by the rate limiter.
+        self.prompt_tokens = len(self.prompt.template) // 4
+        self.packed_prompt_tokens = len(self.packed_prompt.template) // 4
+        self.prompt_version = hashlib.sha256(
+            self.prompt.template.encode("utf-8")
+        ).hexdigest()[:16]
+
+    def parse_triplets(self, raw_output: str):
+        """
+        Parse and return triplets, track any new types for ontology update.
+        Malformed or truncated output keeps every well-formed triplet in it.
+        """
         valid = []
         new_entities, new_relations = set(), set()
-        for triplet in triplet_list:
-            if isinstance(triplet, list) and len(triplet) == 5:
-                s, s_type, p, o, o_type = (x.strip(" \"'[]") for x in triplet)
-                if s_type.startswith("NEW_ENTITY_TYPE:"):
-                    ent_type = s_type.split(":", 1)[1].strip().lower()
-                    new_entities.add(ent_type)
-                    s_type = ent_type
-                if o_type.startswith("NEW_ENTITY_TYPE:"):
-                    ent_type = o_type.split(":", 1)[1].strip().lower()
-                    new_entities.add(ent_type)
-                    o_type = ent_type
-                if p.startswith("NEW_RELATION_TYPE:"):
-                    rel_type = p.split(":", 1)[1].strip().lower()
-                    new_relations.add(rel_type)
-                    p = rel_type
-                valid.append((s, s_type, p, o, o_type))
+        for triplet in parse_triplet_output(raw_output):
+            s, s_type, p, o, o_type = (x.strip(" \"'[]") for x in triplet)
+            if s_type.startswith("NEW_ENTITY_TYPE:"):
+                ent_type = s_type.split(":", 1)[1].strip().lower()
+                new_entities.add(ent_type)
+                s_type = ent_type
+            if o_type.startswith("NEW_ENTITY_TYPE:"):
+                ent_type = o_type.split(":", 1)[1].strip().lower()
+                new_entities.add(ent_type)
+                o_type = ent_type
+            if p.startswith("NEW_RELATION_TYPE:"):
+                rel_type = p.split(":", 1)[1].strip().lower()
+                new_relations.add(rel_type)
+                p = rel_type
+            valid.append((s, s_type, p, o, o_type))
         return valid, new_entities, new_relations
 
     def update_ontology(self, new_entity_types, new_relation_types):
-        updated = False
-        for ent in new_entity_types:
-            if ent not in self.entity_types:
-                print(f"🆕 Adding new entity type to ontology: {ent}")
-                self.entity_types.append(ent)
-                updated = True
-        for rel in new_relation_types:
-            if rel not in self.relation_types:
-                print(f"🆕 Adding new relation type to ontology: {rel}")
-                self.relation_types.append(rel)
-                updated = True
-        if updated:
-            self.ontology["entity_types"] = self.entity_types
-            self.ontology["relation_types"] = self.relation_types
-            save_ontology(self.ontology)
+        """
+        Propose new types to the ontology store, which maps near matches onto
+        existing types; returns the store's {kind: {proposed: type}} mapping.
+        """
+        mapping, added = self.ontology.propose(new_entity_types, new_relation_types)
+        for kind, label in (("entity_types", "entity"), ("relation_types", "relation")):
+            for proposed, found in mapping[kind].items():
+                if proposed in added[kind]:
+                    print(f"🆕 Adding new {label} type to ontology: {proposed}")
+                elif proposed != found:
+                    print(f"🔗 Mapping proposed {label} type {proposed} to {found}")
+        added_entities = added["entity_types"]
+        if added_entities:
+            # New labels need a name index before their first MERGE.
+            try:
+                self.schema.ensure_name_indexes(safe_label(e) for e in added_entities)
+            except Exception as e:
+                print(f"⚠️ Could not create name indexes for new types: {e}")
+        return mapping
+
+    def canonical_types(self, triplet):
+        """Write aliased types (e.g. `webpage` for `website`) as canonical types."""
+        s, s_type, p, o, o_type = triplet
+        entity = self.ontology.canonical
+        return (
+            s,
+            entity("entity_types", s_type) or s_type,
+            entity("relation_types", p) or p,
+            o,
+            entity("entity_types", o_type) or o_type,
+        )
 
     def insert_into_neo4j(self, triplets, chunk_id):
-        with self.driver.session() as session:
+        self.insert_batch([(chunk_id, triplets)])
+
+    def insert_batch(self, chunk_triplets, mentions_only=()):
+        """
+        Write triplets for one or more chunks in a single transaction. Triplets are
+        grouped by (subject label, object label, relation type) and each group is
+        sent as one parameterised UNWIND statement that MERGEs both entities, their
+        relation and the chunk's MENTIONS edges. Labels cannot be parameters, but the
+        statement text per group is stable, so Neo4j reuses its cached plan.
+
+        Chunks listed in `mentions_only` are near-duplicates reusing another chunk's
+        triplets: they only get MENTIONS edges to its entities, as its relations
+        may not hold for them (a different date or figure). Entity names and types
+        are canonicalised by the entity resolver first.
+        """
+        if self.entity_resolver is not None:
+            with telemetry.span("extract.resolve"):
+                chunk_triplets = self.entity_resolver.resolve_triplets(chunk_triplets)
+        groups, mentions = {}, {}
+        for chunk_id, triplets in chunk_triplets:
             for s, s_type, p, o, o_type in triplets:
-                s_label = safe_label(s_type)
-                o_label = safe_label(o_type)
-                rel_type = p.strip().upper().replace(" ", "_").replace("-", "_")
-                # Create or update the entity nodes and their relation
-                query = f"""
-                MERGE (a:{s_label} {{name: $s}})
-                MERGE (b:{o_label} {{name: $o}})
-                MERGE (a)-[r:{rel_type}]->(b)
-                """
-                session.run(query, s=s.strip(), o=o.strip())
-                # Also link the chunk to both subject and object entities
-                mention_query = f"""
-                MERGE (c:Chunk {{chunk_id: $chunk_id}})
-                MERGE (a:{s_label} {{name: $s}})
-                MERGE (b:{o_label} {{name: $o}})
+                key = (safe_label(s_type), safe_label(o_type), safe_rel_type(p))
+                if not all(key) or not s.strip() or not o.strip():
+                    continue
+                row = {"chunk_id": chunk_id, "s": s.strip(), "o": o.strip()}
+                if chunk_id in mentions_only:
+                    mentions.setdefault(key[:2], []).append(row)
+                else:
+                    groups.setdefault(key, []).append(row)
+        if not groups and not mentions:
+            return
+        with self.driver.session() as session:
+            session.execute_write(self._write_triplet_groups, groups, mentions)
+        telemetry.count("db_round_trips", len(groups) + len(mentions), stage="extract")
+        # New MENTIONS change the context of any cached answer using these chunks.
+        invalidate_chunks(chunk_id for chunk_id, _ in chunk_triplets)
+
+    @staticmethod
+    def _write_triplet_groups(tx, groups, mentions=None):
+        for (s_label, o_label), rows in (mentions or {}).items():
+            s_label, o_label = quote_name(s_label), quote_name(o_label)
+            tx.run(
+                f"""
+                UNWIND $rows AS row
+                MERGE (c:Chunk {{chunk_id: row.chunk_id}})
+                MERGE (a:{s_label} {{name: row.s}})
+                MERGE (b:{o_label} {{name: row.o}})
                 MERGE (c)-[:MENTIONS]->(a)
                 MERGE (c)-[:MENTIONS]->(b)
-                """
-                session.run(mention_query, chunk_id=chunk_id, s=s.strip(), o=o.strip())
+                """,
+                rows=rows,
+            )
+        for (s_label, o_label, rel_type), rows in groups.items():
+            s_label, o_label = quote_name(s_label), quote_name(o_label)
+            rel_type = quote_name(rel_type)
+            tx.run(
+                f"""
+                UNWIND $rows AS row
+                MERGE (c:Chunk {{chunk_id: row.chunk_id}})
+                MERGE (a:{s_label} {{name: row.s}})
+                MERGE (b:{o_label} {{name: row.o}})
+                MERGE (a)-[:{rel_type}]->(b)
+                MERGE (c)-[:MENTIONS]->(a)
+                MERGE (c)-[:MENTIONS]->(b)
+                """,
+                rows=rows,
+            )
+
+    def _chunk_id(self, chunk, i):
+        # Robustly extract the chunk_id from chunk (prefer metadata)
+        chunk_id = None
+        # Try attribute first
+        if hasattr(chunk, "chunk_id"):
+            chunk_id = chunk.chunk_id
+        # Then try metadata
+        if not chunk_id and hasattr(chunk, "metadata"):
+            chunk_id = chunk.metadata.get("chunk_id")
+        # Fallback: use index
+        if not chunk_id:
+            chunk_id = f"unknown_chunk_{i}"
+        return chunk_id
+
+    def estimate_tokens(self, text):
+        # ~4 characters per token, plus headroom for the completion.
+        return self.prompt_tokens + len(text) // 4 + 256
+
+    def pack_chunks(self, chunks, indices):
+        """
+        Group `indices` into consecutive packs whose chunk text fits in
+        `pack_token_budget` tokens; one chunk per pack when packing is off.
+        """
+        if not self.pack_token_budget:
+            return [[i] for i in indices]
+        packs, current, used = [], [], 0
+        for i in indices:
+            tokens = len(chunks[i].page_content) // 4 + 8
+            if current and used + tokens > self.pack_token_budget:
+                packs.append(current)
+                current, used = [], 0
+            current.append(i)
+            used += tokens
+        if current:
+            packs.append(current)
+        return packs
+
+    @staticmethod
+    def format_pack(texts):
+        return "\n\n".join(
+            f"### CHUNK {n}\n{text}" for n, text in enumerate(texts, start=1)
+        )
+
+    def parse_packed(self, raw_output, count):
+        """
+        Split a packed JSON response into per-chunk outputs in the single-chunk
+        format. A malformed or truncated response keeps the chunks whose lists are
+        complete; chunks missing from it are None.
+        """
+        triplets = parse_packed_output(raw_output)
+        outputs = []
+        for n in range(1, count + 1):
+            found = triplets.get(str(n))
+            if found is None:
+                outputs.append(None)
+            else:
+                rows = [list(t) for t in found]
+                outputs.append(json.dumps(rows, ensure_ascii=False))
+        return outputs
+
+    async def extract_packed_async(self, texts):
+        """One rate-limited request for several chunks; returns per-chunk outputs."""
+        text = self.format_pack(texts)
+        tokens = self.packed_prompt_tokens + len(text) // 4 + 256 * len(texts)
+
+        async def call():
+            with telemetry.span("extract.wait"):
+                await self.rate_limiter.acquire(tokens)
+            with telemetry.span("extract.llm", chunks=len(texts)):
+                response = await self.packed_chain.ainvoke({"text": text})
+            telemetry.record_usage(response, "extract", tokens - 256 * len(texts))
+            return response
+
+        def on_retry(attempt, delay, e):
+            telemetry.count("api_retries", stage="extract")
+            print(f"🔁 Retry {attempt}/{self.max_retries} in {delay:.1f}s: {e}")
+
+        response = await retry_async(call, self.max_retries, on_retry=on_retry)
+        return self.parse_packed(response.content, len(texts))
+
+    async def extract_async(self, text):
+        """Rate-limited `ainvoke` with jittered backoff on 429/5xx; returns raw content."""
+
+        async def call():
+            tokens = self.estimate_tokens(text)
+            with telemetry.span("extract.wait"):
+                await self.rate_limiter.acquire(tokens)
+            with telemetry.span("extract.llm", chunks=1):
+                response = await self.chain.ainvoke({"text": text})
+            telemetry.record_usage(response, "extract", tokens - 256)
+            return response
 
-    def process_chunks(self, chunks):
+        def on_retry(attempt, delay, e):
+            telemetry.count("api_retries", stage="extract")
+            print(f"🔁 Retry {attempt}/{self.max_retries} in {delay:.1f}s: {e}")
+
+        response = await retry_async(call, self.max_retries, on_retry=on_retry)
+        return response.content
+
+    def handle_response(self, i, chunk, content):
+        """Parse one chunk's LLM output and update the ontology; returns the triplets."""
+        if self.response_log:
+            with open(self.response_log, "a", encoding="utf-8") as f:
+                f.write(json.dumps(content, ensure_ascii=False) + "\n")
+        with telemetry.span("extract.parse"):
+            triplets, new_ents, new_rels = self.parse_triplets(content)
+        if new_ents or new_rels:
+            self.update_ontology(new_ents, new_rels)
+        triplets = [self.canonical_types(t) for t in triplets]
+        if not triplets:
+            print("⚠️ No valid triplets found.")
+        return triplets
+
+    def plan_extractions(self, chunks):
+        """
+        Decide, per chunk, where its triplets come from. Returns a list of
+        (key, signature, cached triplets, leader index, near): cached triplets are
+        set when the extraction cache has the chunk (or a near-duplicate of it);
+        leader is the index of an earlier chunk in `chunks` with the same or
+        nearly the same text, whose LLM response is shared. `near` is true when
+        the triplets come from a near-duplicate rather than the same text.
+        """
+        if self.extraction_cache is None:
+            return [(None, None, None, None, False)] * len(chunks)
+        cache = self.extraction_cache
+        run_index = MinHashLSH(cache.hasher)
+        leaders = {}
+        plans = []
         for i, chunk in enumerate(chunks):
-            print(f"\n📄 Processing chunk {i + 1}/{len(chunks)}")
+            key, signature, cached, match = cache.lookup(
+                self.model_name, self.prompt_version, chunk.page_content
+            )
+            leader, near = None, match == "near"
+            if cached is None:
+                leader = leaders.get(key)
+                if leader is None and cache.near_threshold is not None:
+                    similar = run_index.query(signature, cache.near_threshold)
+                    leader = leaders.get(similar)
+                    near = leader is not None
+                if leader is None:
+                    leaders[key] = i
+                    run_index.add(key, signature)
+            plans.append((key, signature, cached, leader, near))
+        return plans
+
+    def flush_writes(self, pending, on_written=None):
+        """
+        Write `pending` (chunk_id, triplets, cache entry) items in one transaction,
+        then add fresh extractions to the extraction cache. Entries are
+        (key, signature, near); near-duplicates only get MENTIONS edges and are
+        not cached, since their triplets describe another chunk.
+        """
+        with telemetry.span("extract.write", chunks=len(pending)):
+            self.insert_batch(
+                [(chunk_id, triplets) for chunk_id, triplets, _ in pending],
+                mentions_only={
+                    chunk_id for chunk_id, _, entry in pending if entry and entry[2]
+                },
+            )
+        for chunk_id, triplets, _ in pending:
+            if triplets:
+                print(
+                    f"✅ Inserted {len(triplets)} triplets into Neo4j (chunk_id: {chunk_id})"
+                )
+        if self.extraction_cache is not None:
+            # Exact hits carry no signature and are already cached. Empty
+            # results are not cached, as they may be parse failures.
+            self.extraction_cache.put_many(
+                self.model_name,
+                self.prompt_version,
+                [
+                    (entry[0], entry[1], triplets)
+                    for _, triplets, entry in pending
+                    if entry and entry[1] is not None and not entry[2] and triplets
+                ],
+            )
+        if on_written is not None:
+            on_written([chunk_id for chunk_id, _, _ in pending])
+
+    async def aprocess_chunks(self, chunks, on_extracted=None, on_written=None):
+        """
+        Extract and write `chunks`: LLM calls run concurrently, writes in chunk order.
+
+        Hooks: `on_extracted(chunk_id, triplets, near)` once a chunk's triplets are
+        known (`near`: borrowed from a near-duplicate, written as MENTIONS only),
+        `on_written(chunk_ids)` after each commit.
+        """
+        with telemetry.span("extract", chunks=len(chunks)):
+            await self._aprocess_chunks(chunks, on_extracted, on_written)
+
+    async def _aprocess_chunks(self, chunks, on_extracted, on_written):
+        # Types added by another extractor since the last call reach the prompt now.
+        self.refresh_prompts()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        queue = asyncio.Queue(maxsize=self.write_queue_size)
+        with telemetry.span("extract.plan"):
+            plans = self.plan_extractions(chunks)
+
+        async def extract(chunk):
+            async with semaphore:
+                return await self.extract_async(chunk.page_content)
+
+        async def extract_pack(pack):
+            """Map each chunk index in `pack` to its raw single-chunk output."""
+            if len(pack) == 1:
+                return {pack[0]: await extract(chunks[pack[0]])}
+            async with semaphore:
+                outputs = await self.extract_packed_async(
+                    [chunks[i].page_content for i in pack]
+                )
+            results = dict(zip(pack, outputs))
+            missing = [i for i in pack if results[i] is None]
+            if missing:
+                print(f"⚠️ Packed response missed {len(missing)} chunks; retrying")
+                retried = await asyncio.gather(*(extract(chunks[i]) for i in missing))
+                results.update(zip(missing, retried))
+            return results
+
+        async def flush(pending):
             try:
-                response = self.chain.invoke({"text": chunk.page_content})
-                print("📥 Raw triplet output:\n", response.content)
-                triplets, new_ents, new_rels = self.parse_triplets(response.content)
-                if new_ents or new_rels:
-                    self.update_ontology(new_ents, new_rels)
-                if triplets:
-                    # Robustly extract the chunk_id from chunk (prefer metadata)
-                    chunk_id = None
-                    # Try attribute first
-                    if hasattr(chunk, "chunk_id"):
-                        chunk_id = chunk.chunk_id
-                    # Then try metadata
-                    if not chunk_id and hasattr(chunk, "metadata"):
-                        chunk_id = chunk.metadata.get("chunk_id")
-                    # Fallback: use index
-                    if not chunk_id:
-                        chunk_id = f"unknown_chunk_{i}"
-                    self.insert_into_neo4j(triplets, chunk_id)
-                    print(
-                        f"✅ Inserted {len(triplets)} triplets into Neo4j (chunk_id: {chunk_id})"
-                    )
-                else:
-                    print("⚠️ No valid triplets found.")
+                await asyncio.to_thread(self.flush_writes, pending, on_written)
             except Exception as e:
-                print(f"❌ Error processing chunk {i + 1}: {e}")
+                print(f"❌ Error writing {len(pending)} chunks to Neo4j: {e}")
+
+        async def writer():
+            pending = []
+            while True:
+                item = await queue.get()
+                if item is None:
+                    if pending:
+                        await flush(pending)
+                    return
+                i, chunk, content = item
+                key, signature, cached, leader, near = plans[i]
+                print(f"\n📄 Processing chunk {i + 1}/{len(chunks)}")
+                if cached is not None:
+                    print(f"♻️ Reusing cached triplets for chunk {i + 1}")
+                    triplets = cached
+                else:
+                    try:
+                        triplets = await asyncio.to_thread(
+                            self.handle_response, i, chunk, content
+                        )
+                    except Exception as e:
+                        print(f"❌ Error processing chunk {i + 1}: {e}")
+                        continue
+                chunk_id = self._chunk_id(chunk, i)
+                if on_extracted is not None:
+                    try:
+                        on_extracted(chunk_id, triplets, near)
+                    except Exception as e:
+                        print(f"❌ Error recording chunk {i + 1}: {e}")
+                entry = (key, signature, near) if key is not None else None
+                pending.append((chunk_id, triplets, entry))
+                if len(pending) >= self.write_batch_chunks:
+                    await flush(pending)
+                    pending = []
+
+        needed = [
+            i
+            for i, (_, _, cached, leader, _) in enumerate(plans)
+            if cached is None and leader is None
+        ]
+        packs = self.pack_chunks(chunks, needed)
+        todo = asyncio.Queue()
+        for pack in packs:
+            todo.put_nowait(pack)
+        loop = asyncio.get_running_loop()
+        results = {i: loop.create_future() for i in needed}
+        # A pack holds a slot from when a worker takes it until its last chunk is
+        # handed to the writer.
+        slots = asyncio.Semaphore(2 * self.max_concurrency)
+        last_of_pack = {pack[-1] for pack in packs}
+        shared = {leader for *_, leader, _ in plans if leader is not None}
+
+        async def worker():
+            while True:
+                await slots.acquire()
+                if todo.empty():
+                    slots.release()
+                    return
+                pack = todo.get_nowait()
+                try:
+                    outputs = await extract_pack(pack)
+                except Exception as e:
+                    for i in pack:
+                        results[i].set_exception(e)
+                else:
+                    for i in pack:
+                        results[i].set_result(outputs[i])
+
+        writer_task = asyncio.create_task(writer())
+
+        async def hand_over(item):
+            # Raced against the writer: if it dies, nothing drains the queue.
+            put = asyncio.ensure_future(queue.put(item))
+            await asyncio.wait({put, writer_task}, return_when=asyncio.FIRST_COMPLETED)
+            if not put.done():
+                put.cancel()
+                writer_task.result()
+                raise RuntimeError("DB writer stopped before the last chunk")
+
+        workers = [
+            asyncio.create_task(worker())
+            for _ in range(min(self.max_concurrency, len(packs)))
+        ]
+        try:
+            for i, chunk in enumerate(chunks):
+                _, _, cached, leader, _ = plans[i]
+                source = i if leader is None else leader
+                try:
+                    content = None
+                    if cached is None:
+                        content = await results[source]
+                except Exception as e:
+                    print(f"❌ Error processing chunk {i + 1}: {e}")
+                else:
+                    await hand_over((i, chunk, content))
+                if cached is None and leader is None:
+                    if i not in shared:
+                        del results[i]
+                    if i in last_of_pack:
+                        slots.release()
+            await hand_over(None)
+            await writer_task
+        finally:
+            for task in workers:
+                task.cancel()
+            writer_task.cancel()
+
+    def process_chunks(self, chunks, on_extracted=None, on_written=None):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise RuntimeError(
+                "process_chunks() cannot be called from a running event loop; "
+                "await aprocess_chunks() instead"
+            )
+        asyncio.run(self.aprocess_chunks(list(chunks), on_extracted, on_written))
@@ -0,0 +1,234 @@
+import json
+import re
+from json.decoder import scanstring
+
+TRIPLET_FIELDS = ["subject", "subject_type", "relation", "object", "object_type"]
+
+# OpenAI structured-output format: {"triplets": [{subject, subject_type, ...}]}
+TRIPLET_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "triplets",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "triplets": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {f: {"type": "string"} for f in TRIPLET_FIELDS},
+                        "required": TRIPLET_FIELDS,
+                        "additionalProperties": False,
+                    },
+                }
+            },
+            "required": ["triplets"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+_WHITESPACE = " \t\r\n"
+_INCOMPLETE = object()
+# A chunk's entry in a packed response: "12": [
+_PACKED_KEY = re.compile(r'"(\d+)"\s*:\s*\[')
+
+
+def _as_triplet(item):
+    """A 5-string list, or an object with the five schema fields, as a tuple."""
+    if isinstance(item, dict):
+        if all(isinstance(item.get(f), str) for f in TRIPLET_FIELDS):
+            return tuple(item[f] for f in TRIPLET_FIELDS)
+        return None
+    if (
+        isinstance(item, (list, tuple))
+        and len(item) == 5
+        and all(isinstance(x, str) for x in item)
+    ):
+        return tuple(item)
+    return None
+
+
+def _string(text, i):
+    """Parse a quoted string at text[i]; returns (value, end) or _INCOMPLETE/None."""
+    if text[i] == '"':
+        try:
+            return scanstring(text, i + 1, False)
+        except ValueError as e:
+            if str(e).startswith("Unterminated string"):
+                return _INCOMPLETE
+            return None
+    # Python-literal style single quotes, as accepted by the old literal_eval parser
+    j = i + 1
+    while True:
+        k = text.find("'", j)
+        if k < 0:
+            return _INCOMPLETE
+        backslashes = 0
+        while text[k - 1 - backslashes] == "\\":
+            backslashes += 1
+        if backslashes % 2 == 0:
+            value = text[i + 1 : k]
+            if "\\" in value:
+                value = value.replace("\\'", "'").replace("\\\\", "\\")
+            return value, k + 1
+        j = k + 1
+
+
+def _flat_container(text, start):
+    """
+    Parse a `[...]` of strings or `{...}` of string pairs starting at text[start].
+    Returns (items, end), _INCOMPLETE if the text ends first, or None if the
+    container holds anything else (nesting, numbers, junk).
+    """
+    closer = "]" if text[start] == "[" else "}"
+    is_object = closer == "}"
+    items = []
+    n = len(text)
+    i = start + 1
+    while True:
+        while i < n and text[i] in _WHITESPACE:
+            i += 1
+        if i >= n:
+            return _INCOMPLETE
+        c = text[i]
+        if c == closer:
+            return (dict(items) if is_object else items), i + 1
+        if c not in "\"'":
+            return None
+        parsed = _string(text, i)
+        if parsed is None or parsed is _INCOMPLETE:
+            return parsed
+        value, i = parsed
+        if is_object:
+            while i < n and text[i] in _WHITESPACE:
+                i += 1
+            if i >= n:
+                return _INCOMPLETE
+            if text[i] != ":":
+                return None
+            i += 1
+            while i < n and text[i] in _WHITESPACE:
+                i += 1
+            if i >= n:
+                return _INCOMPLETE
+            if text[i] not in "\"'":
+                return None
+            parsed = _string(text, i)
+            if parsed is None or parsed is _INCOMPLETE:
+                return parsed
+            value, i = (value, parsed[0]), parsed[1]
+        items.append(value)
+        while i < n and text[i] in _WHITESPACE:
+            i += 1
+        if i >= n:
+            return _INCOMPLETE
+        if text[i] == ",":
+            i += 1
+        elif text[i] != closer:
+            return None
+
+
+def _scan(text):
+    """Collect every flat 5-field array/object in `text`, skipping anything else."""
+    triplets = []
+    pos = 0
+    while True:
+        brackets = text.find("[", pos)
+        braces = text.find("{", pos)
+        if brackets < 0 and braces < 0:
+            return triplets
+        start = braces if brackets < 0 or 0 <= braces < brackets else brackets
+        parsed = _flat_container(text, start)
+        if parsed is None or parsed is _INCOMPLETE:
+            pos = start + 1
+        else:
+            items, pos = parsed
+            triplet = _as_triplet(items)
+            if triplet is not None:
+                triplets.append(triplet)
+
+
+def _list_end(text, start):
+    """Index just past the `[...]` opening at text[start], or None if it is cut off."""
+    depth = 0
+    i = start
+    while i < len(text):
+        c = text[i]
+        if c == '"':
+            try:
+                _, i = scanstring(text, i + 1, False)
+            except ValueError:
+                return None
+            continue
+        if c == "[":
+            depth += 1
+        elif c == "]":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return None
+
+
+def _unfence(raw_output):
+    """Strip a Markdown code fence (```json ... ```) around a response."""
+    cleaned = raw_output.strip()
+    if cleaned.startswith("```"):
+        cleaned = cleaned.strip("`")
+        if cleaned.startswith("json"):
+            cleaned = cleaned[4:]
+    return cleaned
+
+
+def _from_json(data):
+    if isinstance(data, dict):
+        data = data.get("triplets")
+    if not isinstance(data, list):
+        return None
+    return [t for t in map(_as_triplet, data) if t is not None]
+
+
+def parse_triplet_output(raw_output):
+    """
+    All well-formed triplets in an LLM response, as 5-tuples of strings. Clean
+    JSON (a list of lists or the structured-output object) takes a single
+    `json.loads`; anything else, such as fenced, truncated, single-quoted or
+    partly malformed output, goes through the salvaging scanner, which keeps
+    every complete triplet it can find.
+    """
+    try:
+        triplets = _from_json(json.loads(_unfence(raw_output)))
+    except ValueError:
+        triplets = None
+    if triplets is not None:
+        return triplets
+    return _scan(raw_output)
+
+
+def parse_packed_output(raw_output):
+    """
+    Triplets per chunk id ("1", "2", ...) of a packed response, a JSON object
+    mapping chunk ids to triplet lists. If it does not parse, every chunk whose
+    list is complete is salvaged like `parse_triplet_output`; chunks the
+    response cuts off or leaves out are missing from the result.
+    """
+    try:
+        data = json.loads(_unfence(raw_output))
+    except ValueError:
+        data = None
+    if isinstance(data, dict):
+        outputs = {}
+        for chunk, triplets in data.items():
+            triplets = _from_json(triplets)
+            if triplets is not None:
+                outputs[str(chunk)] = triplets
+        return outputs
+    outputs = {}
+    for match in _PACKED_KEY.finditer(raw_output):
+        start = match.end() - 1
+        end = _list_end(raw_output, start)
+        if end is not None:
+            outputs.setdefault(match.group(1), _scan(raw_output[start:end]))
+    return outputs